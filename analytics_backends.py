@@ -0,0 +1,180 @@
+import argparse
+import math
+import os
+import threading
+from decimal import Decimal
+
+from generations import resolve_database
+
+# Overrides the per-generation export directory (see columnar_directory) when set
+COLUMNAR_DIRECTORY = os.environ.get('COLUMNAR_DIRECTORY')
+
+
+def columnar_directory(catalog):
+    """Where the Parquet export of the catalog database file catalog is written, one per generation."""
+    return os.path.splitext(catalog)[0] + '_columnar'
+
+
+class SQLiteBackend:
+    """Runs queries on the row-store SQLite database."""
+
+    def __init__(self, connect):
+        self.connect = connect
+
+    def execute(self, query, fetch_one=False):
+        connection = self.connect()
+        if connection:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(query)
+                return cursor.fetchone() if fetch_one else cursor.fetchall()
+            finally:
+                cursor.close()
+                connection.close()
+
+
+class DuckDBBackend:
+    """Runs the same SQL with DuckDB's vectorized engine over the Parquet export
+    (see columnar_export.py), exposed as Playlists, Tracks, PlaylistFeatures and ArtistTopTracks views.
+
+    catalog returns the published catalog's path. The export read is the
+    published version of that catalog's directory, checked on every query, so
+    a new generation or a new export is picked up without a restart.
+    """
+
+    def __init__(self, catalog, directory=None):
+        self.catalog = catalog
+        self.directory = directory
+        self.version = None
+        self.connection = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def _connect(self, version):
+        import duckdb
+
+        connection = duckdb.connect()
+        for view, table in (('Playlists', 'playlists'), ('Tracks', 'tracks'),
+                            ('PlaylistFeatures', 'playlist_features'),
+                            ('ArtistTopTracks', 'artist_top_tracks')):
+            path = os.path.join(version, table, '**', '*.parquet')
+            connection.execute(
+                f"CREATE VIEW {view} AS SELECT * FROM read_parquet('{path}', hive_partitioning = true)"
+            )
+        return connection
+
+    def _current(self):
+        directory = self.directory or COLUMNAR_DIRECTORY or columnar_directory(self.catalog())
+        version = resolve_database(directory)
+        with self.lock:
+            if version != self.version:
+                self.connection = self._connect(version)
+                self.version = version
+            return self.version, self.connection
+
+    def execute(self, query, fetch_one=False):
+        version, connection = self._current()
+        # A DuckDB connection must not be shared between threads; each thread gets a cursor
+        cursor = getattr(self.local, 'cursor', None)
+        if cursor is None or self.local.version != version:
+            cursor = self.local.cursor = connection.cursor()
+            self.local.version = version
+        cursor.execute(query)
+        return cursor.fetchone() if fetch_one else cursor.fetchall()
+
+
+def create_backend(name, connect, catalog):
+    # "sharded" runs the queries with a scatter-gather plan on the shard files
+    # (see sharding.py) and everything else on the unsharded SQLite catalog
+    if name in ('sqlite', 'sharded'):
+        return SQLiteBackend(connect)
+    if name == 'duckdb':
+        return DuckDBBackend(catalog)
+    raise ValueError(f"Unknown analytics backend: {name}")
+
+
+def _normalize(value):
+    if isinstance(value, Decimal):
+        value = float(value)
+    if isinstance(value, float):
+        return float(f"{value:.6g}") if math.isfinite(value) else value
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(item) for item in value)
+    return value
+
+
+def _tie_groups(rows):
+    """Split ranked rows into runs with an equal ranking column (the last one), as sorted row lists."""
+    groups = []
+    for row in rows:
+        if groups and groups[-1][0] == row[-1]:
+            groups[-1][1].append(row)
+        else:
+            groups.append((row[-1], [row]))
+    return [(metric, sorted(group, key=repr)) for metric, group in groups]
+
+
+def _same_ranking(expected_rows, actual_rows):
+    """Whether two rankings agree once rows tied on the ranking column are treated as sets.
+
+    Every tie group must hold the same rows, except the last one, which the
+    LIMIT may cut at different rows on each engine; it only has to have the
+    same ranking value and size.
+    """
+    expected_groups = _tie_groups(expected_rows)
+    actual_groups = _tie_groups(actual_rows)
+    if [(metric, len(group)) for metric, group in expected_groups] != \
+            [(metric, len(group)) for metric, group in actual_groups]:
+        return False
+    return expected_groups[:-1] == actual_groups[:-1]
+
+
+def check_parity(functions, backend='duckdb'):
+    """Run each query function on SQLite and on backend; return {name: (matches, sqlite, other)}.
+
+    Rows are compared as multisets with floats rounded to 6 significant digits.
+    Queries with ties at their LIMIT may pick different rows on each engine, so
+    those still match when the rows agree tie group by tie group (see _same_ranking).
+    """
+    import database_queries
+
+    report = {}
+    configured = database_queries.ANALYTICS_BACKEND
+    try:
+        for function in functions:
+            database_queries.ANALYTICS_BACKEND = 'sqlite'
+            expected = function()
+            database_queries.ANALYTICS_BACKEND = backend
+            actual = function()
+            if isinstance(expected, list) and isinstance(actual, list):
+                expected_rows = [_normalize(row) for row in expected]
+                actual_rows = [_normalize(row) for row in actual]
+                matches = (sorted(expected_rows, key=repr) == sorted(actual_rows, key=repr)
+                           or _same_ranking(expected_rows, actual_rows))
+            else:
+                matches = _normalize(expected) == _normalize(actual)
+            report[function.__name__] = (matches, expected, actual)
+    finally:
+        database_queries.ANALYTICS_BACKEND = configured
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that an analytics backend matches SQLite.")
+    parser.add_argument("--backend", default="duckdb")
+    args = parser.parse_args()
+
+    from database_queries import QUERY_FUNCTIONS
+
+    report = check_parity(QUERY_FUNCTIONS, args.backend)
+    for name, (matches, expected, actual) in report.items():
+        print(f"{'ok' if matches else 'MISMATCH'}  {name}")
+        if not matches:
+            print(f"    sqlite:  {expected}")
+            print(f"    {args.backend}: {actual}")
+    if not all(matches for matches, _, _ in report.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
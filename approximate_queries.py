@@ -0,0 +1,201 @@
+import math
+import sqlite3
+
+from database_queries import create_connection
+from sketches import HeavyHitters, HyperLogLog, hash64
+
+# Registers per HyperLogLog: 2**7 bytes gives about 9% standard error, 2**8 about 6.5%
+PLAYLIST_HLL_PRECISION = 7
+ARTIST_HLL_PRECISION = 8
+HEAVY_HITTER_CAPACITY = 100
+
+
+def create_sketch_table(connection):
+    cursor = connection.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS Sketches (
+        name TEXT,
+        key TEXT,
+        data BLOB,
+        estimate REAL,
+        PRIMARY KEY (name, key)
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sketches_estimate ON Sketches(name, estimate)')
+    connection.commit()
+    cursor.close()
+
+
+class SketchBuilder:
+    """Builds the approximate-analytics sketches in one pass over playlist JSON."""
+
+    def __init__(self):
+        self.playlist_artists = {}
+        self.playlist_albums = {}
+        self.artist_collaborators = {}
+        self.top_tracks = HeavyHitters(HEAVY_HITTER_CAPACITY)
+        # Same filter as get_top_artists_by_track_count (followers > 1000)
+        self.top_artists = HeavyHitters(HEAVY_HITTER_CAPACITY)
+
+    def add_playlists(self, playlists):
+        for playlist in playlists:
+            self.add_playlist(playlist)
+
+    def add_playlist(self, playlist):
+        name = playlist["name"]
+        artists_hll = self.playlist_artists.get(name)
+        if artists_hll is None:
+            artists_hll = self.playlist_artists[name] = HyperLogLog(PLAYLIST_HLL_PRECISION)
+            self.playlist_albums[name] = HyperLogLog(PLAYLIST_HLL_PRECISION)
+        albums_hll = self.playlist_albums[name]
+        popular = playlist["num_followers"] > 1000
+
+        artist_hashes = {}
+        for track in playlist["tracks"]:
+            artist = track["artist_name"]
+            if artist not in artist_hashes:
+                artist_hashes[artist] = hash64(artist)
+            artists_hll.add_hash(artist_hashes[artist])
+            albums_hll.add(track["album_name"])
+            self.top_tracks.add(f"{artist}\t{track['track_name']}")
+            if popular:
+                self.top_artists.add(artist)
+
+        # Every pair of artists in the playlist collaborates; hash positions are computed once
+        artists = list(artist_hashes)
+        positions = None
+        for i, artist in enumerate(artists):
+            collaborators = self.artist_collaborators.get(artist)
+            if collaborators is None:
+                collaborators = self.artist_collaborators[artist] = HyperLogLog(ARTIST_HLL_PRECISION)
+            if positions is None:
+                positions = [collaborators.position(artist_hashes[a]) for a in artists]
+            collaborators.add_positions(positions[:i] + positions[i + 1:])
+
+    def save(self, connection):
+        """Merge the sketches into the ones already stored, so ingests can be incremental."""
+        create_sketch_table(connection)
+        cursor = connection.cursor()
+        for name, sketches in (("playlist_artists", self.playlist_artists),
+                               ("playlist_albums", self.playlist_albums),
+                               ("artist_collaborators", self.artist_collaborators)):
+            for key, hll in sketches.items():
+                row = cursor.execute('SELECT data FROM Sketches WHERE name = ? AND key = ?', (name, key)).fetchone()
+                if row:
+                    hll.merge(HyperLogLog.from_bytes(row[0]))
+                cursor.execute('INSERT OR REPLACE INTO Sketches (name, key, data, estimate) VALUES (?, ?, ?, ?)',
+                               (name, key, hll.to_bytes(), hll.estimate()))
+
+        for name, hitters in (("top_tracks", self.top_tracks), ("top_artists", self.top_artists)):
+            row = cursor.execute('SELECT data FROM Sketches WHERE name = ? AND key = ?', (name, '')).fetchone()
+            if row:
+                hitters.merge(HeavyHitters.from_bytes(row[0]))
+            cursor.execute('INSERT OR REPLACE INTO Sketches (name, key, data, estimate) VALUES (?, ?, ?, ?)',
+                           (name, '', hitters.to_bytes(), hitters.sketch.total))
+        connection.commit()
+        cursor.close()
+
+
+def _top_estimates(name, limit=15):
+    connection = create_connection()
+    if connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute('''
+                SELECT key, CAST(ROUND(estimate) AS INTEGER)
+                FROM Sketches
+                WHERE name = ?
+                ORDER BY estimate DESC
+                LIMIT ?;
+            ''', (name, limit))
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"SQLite error: {e}")
+            return None
+        finally:
+            cursor.close()
+            connection.close()
+
+
+def _load_heavy_hitters(name):
+    connection = create_connection()
+    if connection:
+        cursor = connection.cursor()
+        try:
+            row = cursor.execute('SELECT data FROM Sketches WHERE name = ? AND key = ?', (name, '')).fetchone()
+            return HeavyHitters.from_bytes(row[0]) if row else None
+        except sqlite3.Error as e:
+            print(f"SQLite error: {e}")
+            return None
+        finally:
+            cursor.close()
+            connection.close()
+
+
+def identify_playlists_with_most_artists_approx():
+    """Approximate identify_playlists_with_most_artists from per-name HyperLogLogs."""
+    return _top_estimates("playlist_artists")
+
+
+def find_top_artists_with_collaborations_approx():
+    """Approximate find_top_artists_with_collaborations from per-artist HyperLogLogs."""
+    return _top_estimates("artist_collaborators")
+
+
+def find_playlists_with_diverse_artists_and_albums_approx():
+    """Approximate find_playlists_with_diverse_artists_and_albums from per-name HyperLogLogs."""
+    connection = create_connection()
+    if connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute('''
+                SELECT a.key,
+                       CAST(ROUND(a.estimate) AS INTEGER) AS artist_count,
+                       CAST(ROUND(b.estimate) AS INTEGER) AS album_count
+                FROM Sketches a
+                JOIN Sketches b ON b.name = 'playlist_albums' AND b.key = a.key
+                WHERE a.name = 'playlist_artists'
+                ORDER BY (a.estimate + b.estimate) DESC
+                LIMIT 15;
+            ''')
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"SQLite error: {e}")
+            return None
+        finally:
+            cursor.close()
+            connection.close()
+
+
+def get_most_popular_tracks_by_artist_approx():
+    """Approximate get_most_popular_tracks_by_artist from the track heavy hitters."""
+    hitters = _load_heavy_hitters("top_tracks")
+    if hitters is None:
+        return None
+    # Candidates come most frequent first, so the first one seen per artist is its best track
+    best = {}
+    for key, count in hitters.top(hitters.capacity):
+        artist_name, track_name = key.split("\t", 1)
+        best.setdefault(artist_name, (artist_name, track_name, count))
+    return list(best.values())[:15]
+
+
+def get_top_artists_by_track_count_approx():
+    """Approximate get_top_artists_by_track_count from the artist heavy hitters."""
+    hitters = _load_heavy_hitters("top_artists")
+    if hitters is None:
+        return None
+    return hitters.top(15)
+
+
+def describe_error_bound(name):
+    """Human-readable error bound for the sketch behind an approximate query."""
+    if name in ("playlist_artists", "playlist_albums"):
+        return f"±{HyperLogLog(PLAYLIST_HLL_PRECISION).relative_error():.1%} (1 standard error)"
+    if name == "artist_collaborators":
+        return f"±{HyperLogLog(ARTIST_HLL_PRECISION).relative_error():.1%} (1 standard error)"
+    hitters = _load_heavy_hitters(name)
+    if hitters is None:
+        return "unknown (no sketch stored)"
+    confidence = 1 - math.exp(-hitters.sketch.depth)
+    return f"overcount ≤ {hitters.sketch.error_bound():.0f} per item ({confidence:.0%} confidence)"
@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import sqlite3
+
+import numpy as np
+
+from generations import new_version, publish_generation, remove_old_versions, resolve_database
+
+# Pair keys are buffered and folded into running totals once this many are pending
+REDUCE_EVERY = 5_000_000
+
+
+def _reduce(keys, weights):
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    return unique_keys, np.bincount(inverse, weights=weights).astype(np.uint32)
+
+
+class ArtistGraphBuilder:
+    """Accumulates artist co-occurrence counts one playlist at a time."""
+
+    def __init__(self):
+        self.artist_ids = {}
+        self.pending = []
+        self.pending_size = 0
+        self.keys = np.empty(0, dtype=np.int64)
+        self.weights = np.empty(0, dtype=np.uint32)
+
+    def add_playlist(self, artist_names):
+        ids = np.unique(np.fromiter(
+            (self.artist_ids.setdefault(name, len(self.artist_ids)) for name in artist_names),
+            dtype=np.int64,
+        ))
+        if len(ids) < 2:
+            return
+        rows, cols = np.triu_indices(len(ids), 1)
+        self.pending.append((ids[rows] << 32) | ids[cols])
+        self.pending_size += len(rows)
+        if self.pending_size >= REDUCE_EVERY:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        keys = np.concatenate([self.keys] + self.pending)
+        weights = np.concatenate([self.weights, np.ones(self.pending_size, dtype=np.uint32)])
+        self.keys, self.weights = _reduce(keys, weights)
+        self.pending = []
+        self.pending_size = 0
+
+    def build(self):
+        self._flush()
+        n = len(self.artist_ids)
+        low = (self.keys >> 32).astype(np.int32)
+        high = (self.keys & 0xFFFFFFFF).astype(np.int32)
+        # Store every edge in both directions so each row lists all neighbors
+        sources = np.concatenate([low, high])
+        targets = np.concatenate([high, low])
+        weights = np.concatenate([self.weights, self.weights])
+        order = np.lexsort((targets, sources))
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=n), out=indptr[1:])
+        names = [None] * n
+        for name, artist_id in self.artist_ids.items():
+            names[artist_id] = name
+        return ArtistGraph(names, indptr, targets[order], weights[order])
+
+
+class ArtistGraph:
+    """Artist co-occurrence graph in CSR form: row i lists the artists that share
+    a playlist with artist i, weighted by the number of shared playlists."""
+
+    def __init__(self, artists, indptr, indices, weights):
+        self.artists = artists
+        self.artist_ids = {name: i for i, name in enumerate(artists)}
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+
+    def _row(self, artist_id):
+        start, end = self.indptr[artist_id], self.indptr[artist_id + 1]
+        return self.indices[start:end], self.weights[start:end]
+
+    def degree(self, artist_name):
+        """Number of distinct artists that share a playlist with artist_name."""
+        artist_id = self.artist_ids.get(artist_name)
+        if artist_id is None:
+            return 0
+        return int(self.indptr[artist_id + 1] - self.indptr[artist_id])
+
+    def top_degree(self, limit=15):
+        degrees = np.diff(self.indptr)
+        limit = min(limit, len(degrees))
+        if limit == 0:
+            return []
+        top = np.argpartition(-degrees, limit - 1)[:limit]
+        top = top[np.lexsort((top, -degrees[top]))]
+        return [(self.artists[i], int(degrees[i])) for i in top]
+
+    def neighbors(self, artist_name, limit=10):
+        """Artists sharing the most playlists with artist_name."""
+        artist_id = self.artist_ids.get(artist_name)
+        if artist_id is None:
+            return []
+        indices, weights = self._row(artist_id)
+        order = np.argsort(-weights.astype(np.int64), kind='stable')[:limit]
+        return [(self.artists[indices[i]], int(weights[i])) for i in order]
+
+    def similar_artists(self, favorite_artists, limit=10, fanout=50):
+        """Two-hop "artists like your favorites": direct co-occurrence plus the
+        neighbors of each favorite's strongest neighbors, excluding the favorites."""
+        favorite_ids = [self.artist_ids[name] for name in favorite_artists if name in self.artist_ids]
+        if not favorite_ids:
+            return []
+        scores = np.zeros(len(self.artists), dtype=np.float64)
+        for artist_id in favorite_ids:
+            indices, weights = self._row(artist_id)
+            if len(indices) == 0:
+                continue
+            weights = weights.astype(np.float64)
+            strength = weights.sum()
+            np.add.at(scores, indices, weights / strength)
+            for neighbor in np.argsort(-weights, kind='stable')[:fanout]:
+                second, second_weights = self._row(indices[neighbor])
+                second_weights = second_weights.astype(np.float64)
+                share = weights[neighbor] / strength
+                np.add.at(scores, second, 0.5 * share * second_weights / second_weights.sum())
+        scores[favorite_ids] = 0
+        candidates = np.flatnonzero(scores)
+        order = candidates[np.argsort(-scores[candidates], kind='stable')][:limit]
+        return [(self.artists[i], float(scores[i])) for i in order]
+
+    def save(self, directory):
+        """Write the graph into a new version of directory and publish it in one rename."""
+        # Processes that have the old arrays memory-mapped keep reading the old version
+        version = new_version(directory)
+        for name, values in (('indptr', self.indptr), ('indices', self.indices), ('weights', self.weights)):
+            with open(os.path.join(version, f'{name}.npy'), 'wb') as f:
+                np.save(f, values)
+        with open(os.path.join(version, 'artists.json'), 'w') as f:
+            json.dump(self.artists, f)
+        publish_generation(directory, version)
+        remove_old_versions(directory)
+
+    @classmethod
+    def load(cls, directory):
+        """Open a saved graph version; the adjacency arrays are memory-mapped, not read into memory."""
+        with open(os.path.join(directory, 'artists.json')) as f:
+            artists = json.load(f)
+        arrays = [np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+                  for name in ('indptr', 'indices', 'weights')]
+        return cls(artists, *arrays)
+
+
+def graph_directory(catalog):
+    """Where the graph of the catalog database file catalog is saved, e.g. one per generation."""
+    return os.path.splitext(catalog)[0] + '_artist_graph'
+
+
+_loaded_graphs = {}
+
+
+def load_graph(database):
+    """Return the graph saved for database's published catalog, reloading it if it was rebuilt, or None."""
+    version = resolve_database(graph_directory(resolve_database(database)))
+    cached = _loaded_graphs.get(database)
+    if cached is None or cached[0] != version:
+        if not os.path.exists(os.path.join(version, 'artists.json')):
+            return None
+        try:
+            graph = ArtistGraph.load(version)
+        except FileNotFoundError:
+            # Rebuilt twice while it was being opened, so its version was removed; open the newest
+            return load_graph(database)
+        cached = _loaded_graphs[database] = (version, graph)
+    return cached[1]
+
+
+def build_from_database(connection):
+    """Build the graph in one streaming pass over Tracks ordered by playlist."""
+    builder = ArtistGraphBuilder()
+    cursor = connection.cursor()
+    cursor.execute('SELECT playlist_id, artist_name FROM Tracks ORDER BY playlist_id')
+    current_playlist = None
+    artists = []
+    for playlist_id, artist_name in cursor:
+        if playlist_id != current_playlist:
+            builder.add_playlist(artists)
+            current_playlist = playlist_id
+            artists = []
+        artists.append(artist_name)
+    builder.add_playlist(artists)
+    cursor.close()
+    return builder.build()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the artist co-occurrence graph.")
+    parser.add_argument("--database", default="recommendation.db")
+    args = parser.parse_args()
+
+    # Built from and saved next to the catalog generation currently published for the database
+    catalog = resolve_database(args.database)
+    connection = sqlite3.connect(f"file:{catalog}?mode=ro", uri=True)
+    graph = build_from_database(connection)
+    connection.close()
+    graph.save(graph_directory(catalog))
+    print(f"Saved graph with {len(graph.artists)} artists and {len(graph.indices) // 2} edges "
+          f"to {graph_directory(catalog)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import sqlite3
+
+from generations import require_unpublished
+from trending_queries import create_trending_tables
+
+# Tracks kept per artist; the Recommendations page shows 5 and the dashboard 1
+TOP_TRACKS_PER_ARTIST = 10
+
+
+def create_top_tracks_table(connection):
+    cursor = connection.cursor()
+    # Keyed by artist so one artist's ranking is a single range read
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ArtistTopTracks (
+        artist_name TEXT,
+        track_rank INTEGER,
+        track_name TEXT,
+        track_count INTEGER,
+        PRIMARY KEY (artist_name, track_rank)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_artist_top_tracks_rank ON ArtistTopTracks(track_rank, track_count)')
+    connection.commit()
+    cursor.close()
+
+
+def refresh_top_tracks(connection, artists=None):
+    """Recompute the top tracks of the given artists (all artists if artists is None).
+
+    Tracks keeps each track_uri under its first playlist only, so a COUNT over
+    it is 1 for almost every track. Occurrences are summed from
+    TrackMonthlyCounts instead, which counts every track of every imported
+    playlist (see trending_queries.py). Refreshing the artists of each
+    ingested batch keeps the table current. Ties are broken by track name.
+    """
+    create_top_tracks_table(connection)
+    create_trending_tables(connection)
+    query = '''
+        INSERT INTO ArtistTopTracks (artist_name, track_rank, track_name, track_count)
+        SELECT artist_name, track_rank, track_name, track_count
+        FROM (
+            SELECT artist_name, track_name, SUM(track_count) AS track_count,
+                   ROW_NUMBER() OVER (PARTITION BY artist_name ORDER BY SUM(track_count) DESC, track_name) AS track_rank
+            FROM TrackMonthlyCounts
+            {where}
+            GROUP BY artist_name, track_name
+        )
+        WHERE track_rank <= ?
+    '''
+    cursor = connection.cursor()
+    if artists is None:
+        cursor.execute('DELETE FROM ArtistTopTracks')
+        cursor.execute(query.format(where=''), (TOP_TRACKS_PER_ARTIST,))
+    else:
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS refresh_artists (artist_name TEXT PRIMARY KEY)')
+        cursor.execute('DELETE FROM refresh_artists')
+        cursor.execute('INSERT OR IGNORE INTO refresh_artists SELECT value FROM json_each(?)',
+                       (json.dumps(sorted(set(artists))),))
+        cursor.execute('DELETE FROM ArtistTopTracks WHERE artist_name IN (SELECT artist_name FROM refresh_artists)')
+        cursor.execute(query.format(where='WHERE artist_name IN (SELECT artist_name FROM refresh_artists)'),
+                       (TOP_TRACKS_PER_ARTIST,))
+    connection.commit()
+    cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill the ArtistTopTracks table from TrackMonthlyCounts "
+                                                 "(python trending_queries.py rebuilds those from the slices).")
+    parser.add_argument("--database", default=os.environ.get('RECOMMENDATION_DB', 'recommendation.db'))
+    args = parser.parse_args()
+
+    require_unpublished(args.database)
+    connection = sqlite3.connect(args.database)
+    refresh_top_tracks(connection)
+    count = connection.execute('SELECT COUNT(DISTINCT artist_name) FROM ArtistTopTracks').fetchone()[0]
+    connection.close()
+    print(f"Computed top tracks for {count} artists in {args.database}")
+
+
+if __name__ == "__main__":
+    main()
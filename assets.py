@@ -0,0 +1,57 @@
+import base64
+import os
+
+# Served by Streamlit at app/static/ when server.enableStaticServing is on
+STATIC_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+# The background sits behind semi-transparent panels, so a small, softer copy is enough
+BACKGROUND_WIDTH = 1600
+BACKGROUND_QUALITY = 60
+
+MIME_TYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg'}
+
+
+def optimize_image(source_path, name, width=BACKGROUND_WIDTH, quality=BACKGROUND_QUALITY):
+    """Resize and recompress an image into the static directory, once.
+
+    The optimized copy is reused until the source file changes. Returns the
+    path of the optimized file and its format.
+    """
+    from PIL import Image, features
+
+    image_format = 'WEBP' if features.check('webp') else 'JPEG'
+    extension = 'webp' if image_format == 'WEBP' else 'jpg'
+    target_path = os.path.join(STATIC_DIRECTORY, f'{name}.{extension}')
+
+    if (os.path.exists(target_path)
+            and os.path.getmtime(target_path) >= os.path.getmtime(source_path)):
+        return target_path, image_format
+
+    os.makedirs(STATIC_DIRECTORY, exist_ok=True)
+    with Image.open(source_path) as image:
+        # Let the JPEG decoder downscale while decoding instead of loading all pixels
+        image.draft('RGB', (width, width))
+        image = image.convert('RGB')
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        # Write next to the target and rename, so concurrent readers never see a partial file
+        options = {'quality': quality, 'optimize': True}
+        if image_format == 'WEBP':
+            options['method'] = 6
+        image.save(target_path + '.tmp', format=image_format, **options)
+    os.replace(target_path + '.tmp', target_path)
+    return target_path, image_format
+
+
+def background_url(source_path, static_serving=False):
+    """CSS url() value for the optimized background image.
+
+    With Streamlit static serving enabled the browser fetches (and caches) the
+    file once; otherwise the small optimized copy is inlined as a data URI.
+    """
+    path, image_format = optimize_image(source_path, 'background')
+    if static_serving:
+        return f"app/static/{os.path.basename(path)}"
+    with open(path, 'rb') as image_file:
+        encoded = base64.b64encode(image_file.read()).decode()
+    return f"data:{MIME_TYPES[image_format]};base64,{encoded}"
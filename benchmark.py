@@ -0,0 +1,487 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+from datetime import datetime
+
+import numpy as np
+
+import analytics_backends
+import artist_graph
+import columnar_export
+import credentials
+import database_queries
+import embeddings
+import import_json
+import json_decoding
+import query_registry
+import recommendations
+import sharding
+from bplus_tree import BPlusTree
+from synthetic_data import generate_slices
+from write_queue import WriteQueue
+
+
+
+def time_call(function, *args, repeat=3):
+    """Run function repeat times and return (timings in seconds, last result)."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+
+def record(results, scale, suite, name, timings, **extra):
+    entry = {
+        "scale": scale,
+        "suite": suite,
+        "name": name,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "timings": timings,
+    }
+    entry.update(extra)
+    results.append(entry)
+    print(f"[{scale}] {suite}/{name}: median {entry['median'] * 1000:.2f} ms")
+
+
+def use_database(path):
+    """Point every module at the benchmark database."""
+    database_queries.DATABASE = path
+    import_json.DATABASE = path
+    recommendations.DATABASE = path
+    query_registry.DATABASE = path
+    embeddings.EMBEDDING_DIRECTORY = os.path.splitext(path)[0] + '_embeddings'
+
+
+def bench_ingest(results, scale, data_dir, database):
+    if os.path.exists(database):
+        os.remove(database)
+    use_database(database)
+    start = time.perf_counter()
+    import_json.main(os.path.join(data_dir, 'mpd.slice.*.json'))
+    elapsed = time.perf_counter() - start
+
+    connection = sqlite3.connect(database)
+    track_rows = connection.execute('SELECT COUNT(*) FROM Tracks').fetchone()[0]
+    connection.close()
+    record(results, scale, "ingest", "import_json", [elapsed],
+           playlists=scale, track_rows=track_rows,
+           playlists_per_second=scale / elapsed)
+
+
+def bench_ingest_archive(results, scale, data_dir, database):
+    """Ingest the same slices straight from a zip archive, as the MPD download ships."""
+    archive = data_dir + '.zip'
+    if not os.path.exists(archive):
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as z:
+            for path in sorted(os.listdir(data_dir)):
+                z.write(os.path.join(data_dir, path), f'data/{path}')
+    archive_database = os.path.splitext(database)[0] + '_archive.db'
+    if os.path.exists(archive_database):
+        os.remove(archive_database)
+    use_database(archive_database)
+    try:
+        start = time.perf_counter()
+        import_json.main(archive, build_graph=False)
+        elapsed = time.perf_counter() - start
+    finally:
+        use_database(database)
+    record(results, scale, "ingest", "import_zip", [elapsed],
+           playlists=scale, archive_bytes=os.path.getsize(archive), playlists_per_second=scale / elapsed)
+
+
+def bench_json_decoding(results, scale, data_dir, repeat):
+    """Decode one slice with every installed backend."""
+    path = os.path.join(data_dir, sorted(os.listdir(data_dir))[0])
+    with open(path, 'rb') as f:
+        data = f.read()
+    for name in json_decoding.available_decoders():
+        decoder = json_decoding.get_decoder(name)
+        timings, playlists = time_call(decoder, data, repeat=repeat)
+        record(results, scale, "json_decoding", name, timings,
+               slice_bytes=len(data), playlists=len(playlists), megabytes_per_second=len(data) / min(timings) / 1e6)
+
+
+def bench_database_queries(results, scale, repeat):
+    for function in database_queries.QUERY_FUNCTIONS:
+        timings, _ = time_call(function, repeat=repeat)
+        record(results, scale, "database_queries", function.__name__, timings)
+
+
+def sample_favorites(database, count, rng):
+    connection = sqlite3.connect(database)
+    artists = [row[0] for row in connection.execute('''
+        SELECT artist_name FROM Tracks GROUP BY artist_name ORDER BY COUNT(*) DESC LIMIT 200
+    ''')]
+    connection.close()
+    return rng.sample(artists, min(count, len(artists)))
+
+
+def bench_recommendations(results, scale, database, repeat, rng):
+    favorites = sample_favorites(database, 5, rng)
+    for function in (recommendations.get_tracks_for_favorite_artists,
+                     recommendations.get_duration_histogram,
+                     recommendations.suggest_new_artists,
+                     recommendations.get_recommended_tracks):
+        timings, _ = time_call(function, favorites, repeat=repeat)
+        record(results, scale, "recommendations", function.__name__, timings, favorites=len(favorites))
+
+    timings, _ = time_call(recommendations.search_albums_and_tracks_by_artist, favorites[0], repeat=repeat)
+    record(results, scale, "recommendations", "search_albums_and_tracks_by_artist", timings)
+
+    timings, _ = time_call(recommendations.build_artist_popularity_index, repeat=repeat)
+    record(results, scale, "recommendations", "build_artist_popularity_index", timings)
+
+
+# The json_each IN-list form the favorite-artist queries used before the temp table
+LEGACY_SUGGEST_NEW_ARTISTS = '''
+    SELECT DISTINCT t2.artist_name, COUNT(*) as artist_count
+    FROM Tracks t1
+    JOIN Tracks t2 ON t1.playlist_id = t2.playlist_id
+    WHERE t1.artist_name IN (SELECT value FROM json_each(?1))
+    AND t2.artist_name NOT IN (SELECT value FROM json_each(?1))
+    GROUP BY t2.artist_name
+    ORDER BY artist_count DESC
+    LIMIT 10
+'''
+
+
+def bench_favorites_scaling(results, scale, database, repeat, rng):
+    """Favorite-set queries as the set grows from 1 to 10,000 artists.
+
+    Every set holds the same five real artists padded with unknown names, so the
+    rows matched stay fixed and the timings show only the cost of the set itself.
+    The `registry_` and `legacy_` entries run on the same connection, so they
+    compare the two query forms alone; the app-level entries add the connection
+    pool and DataFrame construction on top. The cost is not flat: loading the
+    favorite_set table is linear in the set (about 1 us per artist), which is
+    what dominates at 10,000.
+    """
+    real = sample_favorites(database, 5, rng)
+    connection = sqlite3.connect(database)
+    suggest = query_registry.QUERIES['suggest_new_artists']
+    for size in (1, 10, 100, 1000, 10000):
+        favorites = real[:size] + [f'unknown artist {i}' for i in range(size - len(real[:size]))]
+        timings, _ = time_call(recommendations.suggest_new_artists, favorites, repeat=repeat)
+        record(results, scale, "favorites_scaling", f"suggest_new_artists_{size}", timings, favorites=size)
+        timings, _ = time_call(recommendations.get_recommended_tracks, favorites, repeat=repeat)
+        record(results, scale, "favorites_scaling", f"get_recommended_tracks_{size}", timings, favorites=size)
+
+        def registry():
+            query_registry.load_favorite_set(connection, favorites)
+            return connection.execute(suggest).fetchall()
+        timings, _ = time_call(registry, repeat=repeat)
+        record(results, scale, "favorites_scaling", f"registry_suggest_new_artists_{size}", timings, favorites=size)
+        timings, _ = time_call(lambda: connection.execute(LEGACY_SUGGEST_NEW_ARTISTS, (json.dumps(favorites),)).fetchall(),
+                               repeat=repeat)
+        record(results, scale, "favorites_scaling", f"legacy_suggest_new_artists_{size}", timings, favorites=size)
+    connection.close()
+
+
+def bench_user_writes(results, scale, database, threads=8, writes_per_thread=250):
+    """Favorite-artist inserts from concurrent sessions: a commit per row vs. the group-commit queue."""
+    recommendations.create_users_table()
+    insert = 'INSERT INTO FavoriteArtists (username, artist_name) VALUES (?, ?)'
+
+    def run_threads(write):
+        def worker(thread):
+            for i in range(writes_per_thread):
+                write(f'bench user {thread}', f'bench artist {i}')
+        workers = [threading.Thread(target=worker, args=(thread,)) for thread in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        connection = sqlite3.connect(database)
+        connection.execute("DELETE FROM FavoriteArtists WHERE username LIKE 'bench user %'")
+        connection.commit()
+        connection.close()
+        return elapsed
+
+    def commit_per_row(username, artist_name):
+        connection = sqlite3.connect(database, timeout=30)
+        connection.execute('PRAGMA synchronous=FULL')
+        connection.execute(insert, (username, artist_name))
+        connection.commit()
+        connection.close()
+
+    writes = threads * writes_per_thread
+    elapsed = run_threads(commit_per_row)
+    record(results, scale, "user_writes", "commit_per_row", [elapsed], writes=writes, writes_per_second=writes / elapsed)
+
+    write_queue = WriteQueue(database)
+    elapsed = run_threads(lambda username, artist_name: write_queue.execute(insert, (username, artist_name)))
+    write_queue.close()
+    record(results, scale, "user_writes", "write_queue", [elapsed], writes=writes, writes_per_second=writes / elapsed)
+
+
+def bench_login(results, scale, database, threads=8, logins_per_thread=8):
+    """Concurrent logins at the configured scrypt cost."""
+    recommendations.create_users_table()
+    users = [(f'bench login {i}', f'password {i}') for i in range(threads)]
+    connection = sqlite3.connect(database)
+    connection.executemany('INSERT OR REPLACE INTO Users (username, password) VALUES (?, ?)',
+                           [(username, credentials.hash_password(password)) for username, password in users])
+    connection.commit()
+
+    latencies = []
+
+    def worker(username, password):
+        for _ in range(logins_per_thread):
+            start = time.perf_counter()
+            assert recommendations.login_user(username, password)
+            latencies.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker, args=user) for user in users]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    connection.execute("DELETE FROM Users WHERE username LIKE 'bench login %'")
+    connection.commit()
+    connection.close()
+    record(results, scale, "login", "scrypt_login", latencies,
+           logins_per_second=len(latencies) / elapsed, threads=threads,
+           kdf_workers=credentials.KDF_WORKERS, scrypt_n=credentials.SCRYPT_N)
+
+
+def bench_bplus_tree(results, scale, database, repeat, rng):
+    connection = sqlite3.connect(database)
+    artists = connection.execute('SELECT artist_name, COUNT(*) FROM Tracks GROUP BY artist_name').fetchall()
+    connection.close()
+    rng.shuffle(artists)
+
+    def build():
+        tree = BPlusTree(order=4)
+        for name, count in artists:
+            tree.insert(name, count)
+        return tree
+
+    timings, tree = time_call(build, repeat=repeat)
+    record(results, scale, "bplus_tree", "insert", timings, keys=len(artists))
+
+    lookups = [name for name, _ in rng.sample(artists, min(1000, len(artists)))]
+    timings, _ = time_call(lambda: [tree.get_artist_popularity(name) for name in lookups], repeat=repeat)
+    record(results, scale, "bplus_tree", "get_artist_popularity", timings, lookups=len(lookups))
+
+    timings, _ = time_call(tree.get_top_artists, 5, repeat=repeat)
+    record(results, scale, "bplus_tree", "get_top_artists", timings)
+
+
+def bench_artist_graph(results, scale, database, repeat, rng):
+    connection = sqlite3.connect(database)
+    timings, graph = time_call(artist_graph.build_from_database, connection, repeat=1)
+    connection.close()
+    record(results, scale, "artist_graph", "build", timings, artists=len(graph.artists), edges=len(graph.indices) // 2)
+
+    favorites = rng.sample(graph.artists, min(5, len(graph.artists)))
+    timings, _ = time_call(graph.top_degree, 15, repeat=repeat)
+    record(results, scale, "artist_graph", "top_degree", timings)
+    timings, _ = time_call(graph.neighbors, favorites[0], repeat=repeat)
+    record(results, scale, "artist_graph", "neighbors", timings)
+    timings, _ = time_call(graph.similar_artists, favorites, repeat=repeat)
+    record(results, scale, "artist_graph", "similar_artists", timings, favorites=len(favorites))
+
+
+def bench_embeddings(results, scale, data_dir, repeat, rng):
+    timings, index = time_call(embeddings.build_from_files, os.path.join(data_dir, 'mpd.slice.*.json'), repeat=1)
+    index.save()
+    record(results, scale, "embeddings", "build", timings,
+           tracks=len(index.track_uris), lists=len(index.centroids))
+
+    # Recall of the IVF search against an exact scan over every vector
+    queries = [int(i) for i in rng.sample(range(len(index.track_uris)), min(100, len(index.track_uris)))]
+    hits = 0
+    for track_id in queries:
+        scores = index.vectors @ index.vectors[track_id]
+        exact = set(np.argpartition(-scores, 9)[:10].tolist())
+        hits += len(exact & {i for i, _ in index.search(index.vectors[track_id], 10)})
+    timings, _ = time_call(lambda: [index.similar_tracks(index.track_uris[i]) for i in queries], repeat=repeat)
+    record(results, scale, "embeddings", "similar_tracks", timings,
+           queries=len(queries), recall_at_10=hits / (10 * len(queries)))
+
+    favorites = rng.sample(index.artists, min(5, len(index.artists)))
+    timings, _ = time_call(index.recommend_for_artists, favorites, repeat=repeat)
+    record(results, scale, "embeddings", "recommend_for_artists", timings, favorites=len(favorites))
+
+
+def bench_duckdb(results, scale, database, repeat):
+    directory = analytics_backends.columnar_directory(database)
+    connection = sqlite3.connect(database)
+    timings, _ = time_call(columnar_export.export_database, connection, directory, repeat=1)
+    connection.close()
+    record(results, scale, "duckdb", "export", timings)
+
+    analytics_backends.COLUMNAR_DIRECTORY = directory
+    database_queries.ANALYTICS_BACKEND = 'duckdb'
+    try:
+        for function in database_queries.QUERY_FUNCTIONS:
+            timings, _ = time_call(function, repeat=repeat)
+            record(results, scale, "duckdb", function.__name__, timings)
+    finally:
+        database_queries.ANALYTICS_BACKEND = 'sqlite'
+        database_queries._backends.pop('duckdb', None)
+
+
+def bench_sharded(results, scale, database, repeat):
+    shards = sharding.SHARD_COUNT or os.cpu_count()
+    timings, problems = time_call(sharding.split_database, database, shards, repeat=1)
+    if problems:
+        print(f"[{scale}] sharded: " + "; ".join(problems))
+    record(results, scale, "sharded", "split", timings, shards=shards, workers=sharding.SHARD_WORKERS)
+
+    database_queries.ANALYTICS_BACKEND = 'sharded'
+    try:
+        # Start the worker processes outside the timings
+        database_queries.QUERY_FUNCTIONS[0]()
+        for function in database_queries.QUERY_FUNCTIONS:
+            timings, _ = time_call(function, repeat=repeat)
+            record(results, scale, "sharded", function.__name__, timings)
+    finally:
+        database_queries.ANALYTICS_BACKEND = 'sqlite'
+        sharding.remove_shards(database)
+
+
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=600)
+app.run()
+cold = time.perf_counter() - start
+warm = []
+for _ in range(int(sys.argv[2])):
+    start = time.perf_counter()
+    app.run()
+    warm.append(time.perf_counter() - start)
+print(json.dumps({"cold": cold, "warm": warm, "exceptions": len(app.exception)}))
+"""
+
+
+def bench_startup(results, scale, database, repeat):
+    """Time a cold start of app.py in a fresh process and warm reruns after it."""
+    app_directory = os.path.dirname(os.path.abspath(__file__))
+    cold = []
+    warm = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, os.path.join(app_directory, "app.py"), str(repeat)],
+            cwd=app_directory,
+            env=dict(os.environ, RECOMMENDATION_DB=os.path.abspath(database)),
+            capture_output=True, text=True, check=True,
+        ).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+        if timings["exceptions"]:
+            print(f"[{scale}] startup: app.py raised an exception")
+        cold.append(timings["cold"])
+        warm.extend(timings["warm"])
+    record(results, scale, "startup", "cold_start", cold)
+    record(results, scale, "startup", "warm_rerun", warm)
+
+
+def compare(results, baseline_path, threshold):
+    """Print median ratios against a previous run and return the regressions."""
+    with open(baseline_path) as f:
+        baseline = {(r["scale"], r["suite"], r["name"]): r for r in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["scale"], result["suite"], result["name"]))
+        if previous is None or previous["median"] == 0:
+            continue
+        ratio = result["median"] / previous["median"]
+        flag = " REGRESSION" if ratio > threshold else ""
+        print(f"[{result['scale']}] {result['suite']}/{result['name']}: {ratio:.2f}x{flag}")
+        if flag:
+            regressions.append(result)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest, queries and indexes on synthetic MPD data.")
+    parser.add_argument("--playlists", type=int, nargs="+", default=[1000],
+                        help="Scales to run, e.g. --playlists 1000 100000 1000000")
+    parser.add_argument("--suites", nargs="+", help="Also available: duckdb, sharded, favorites_scaling, user_writes, login, ingest_archive, json_decoding",
+                        default=["ingest", "database_queries", "recommendations", "bplus_tree", "artist_graph", "embeddings", "startup"])
+    parser.add_argument("--workdir", default="bench_data")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Previous results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Median ratio above which a result counts as a regression")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.playlists:
+        rng = random.Random(args.seed)
+        data_dir = os.path.join(args.workdir, f"data_{scale}")
+        database = os.path.join(args.workdir, f"bench_{scale}.db")
+        if not os.path.isdir(data_dir):
+            print(f"Generating {scale} synthetic playlists in {data_dir}")
+            generate_slices(data_dir, scale, seed=args.seed)
+
+        use_database(database)
+        if "ingest" in args.suites or not os.path.exists(database):
+            bench_ingest(results, scale, data_dir, database)
+        if "ingest_archive" in args.suites:
+            bench_ingest_archive(results, scale, data_dir, database)
+        if "json_decoding" in args.suites:
+            bench_json_decoding(results, scale, data_dir, args.repeat)
+        if "database_queries" in args.suites:
+            bench_database_queries(results, scale, args.repeat)
+        if "recommendations" in args.suites:
+            bench_recommendations(results, scale, database, args.repeat, rng)
+        if "favorites_scaling" in args.suites:
+            bench_favorites_scaling(results, scale, database, args.repeat, rng)
+        if "user_writes" in args.suites:
+            bench_user_writes(results, scale, database)
+        if "login" in args.suites:
+            bench_login(results, scale, database)
+        if "bplus_tree" in args.suites:
+            bench_bplus_tree(results, scale, database, args.repeat, rng)
+        if "artist_graph" in args.suites:
+            bench_artist_graph(results, scale, database, args.repeat, rng)
+        if "embeddings" in args.suites:
+            bench_embeddings(results, scale, data_dir, args.repeat, rng)
+        if "duckdb" in args.suites:
+            bench_duckdb(results, scale, database, args.repeat)
+        if "sharded" in args.suites:
+            bench_sharded(results, scale, database, args.repeat)
+        if "startup" in args.suites:
+            bench_startup(results, scale, database, args.repeat)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            "created_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "seed": args.seed,
+            "results": results,
+        }, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} benchmark(s) regressed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# B+ Tree Node Class
+class BPlusTreeNode:
+    def __init__(self, order):
+        self.order = order
+        self.keys = []
+        self.values = [] 
+        self.children = []
+        self.is_leaf = True
+
+    def insert_non_full(self, key, value):
+        i = len(self.keys) - 1
+        if self.is_leaf:
+            self.keys.append(None)
+            self.values.append(None)
+            while i >= 0 and key < self.keys[i]:
+                self.keys[i + 1] = self.keys[i]
+                self.values[i + 1] = self.values[i]
+                i -= 1
+            self.keys[i + 1] = key
+            self.values[i + 1] = value
+        else:
+
+            while i >= 0 and key < self.keys[i]:
+                i -= 1
+            i += 1
+            if len(self.children[i].keys) == self.order - 1:
+                self.split_child(i)
+                if key > self.keys[i]:
+                    i += 1
+            self.children[i].insert_non_full(key, value)
+
+    def split_child(self, i):
+        order = self.order
+        new_node = BPlusTreeNode(order)
+        node_to_split = self.children[i]
+        new_node.is_leaf = node_to_split.is_leaf
+        mid = order // 2
+
+        new_node.keys = node_to_split.keys[mid:]
+        new_node.values = node_to_split.values[mid:]
+        node_to_split.keys = node_to_split.keys[:mid]
+        node_to_split.values = node_to_split.values[:mid]
+
+        if not node_to_split.is_leaf:
+            new_node.children = node_to_split.children[mid:]
+            node_to_split.children = node_to_split.children[:mid]
+
+        self.children.insert(i + 1, new_node)
+        self.keys.insert(i, node_to_split.keys.pop())
+        self.values.insert(i, node_to_split.values.pop())
+
+    def traverse(self):
+        if self.is_leaf:
+            for key, value in zip(self.keys, self.values):
+                print(f'Artist: {key}, Total Plays: {value}')
+        else:
+            for i in range(len(self.keys)):
+                self.children[i].traverse()
+                print(f'Artist: {self.keys[i]}, Total Plays: {self.values[i]}')
+            self.children[-1].traverse()
+
+
+class BPlusTree:
+    def __init__(self, order):
+        self.root = BPlusTreeNode(order)
+        self.order = order
+
+    def insert(self, key, value):
+        root = self.root
+        if len(root.keys) == self.order - 1:
+            new_node = BPlusTreeNode(self.order)
+            new_node.is_leaf = False
+            new_node.children.append(self.root)
+            new_node.split_child(0)
+            self.root = new_node
+
+        self.root.insert_non_full(key, value)
+
+    def traverse(self):
+        self.root.traverse()
+
+    def get_top_artists(self, top_n=5):
+        result = []
+
+        def _gather_artists(node):
+            if node.is_leaf:
+                result.extend(zip(node.keys, node.values))
+            else:
+                for i in range(len(node.keys)):
+                    _gather_artists(node.children[i])
+                    result.append((node.keys[i], node.values[i]))
+                _gather_artists(node.children[-1])
+
+        _gather_artists(self.root)
+        result.sort(key=lambda x: x[1], reverse=True)
+        return result[:top_n]
+
+
+    def get_artist_popularity(self, artist_name):
+        node = self.root
+        while node:
+            if artist_name in node.keys:
+                index = node.keys.index(artist_name)
+                return node.values[index]
+            elif node.is_leaf:
+                return None
+            else:
+                for i, key in enumerate(node.keys):
+                    if artist_name < key:
+                        node = node.children[i]
+                        break
+                else:
+                    node = node.children[-1]
+        return None
@@ -0,0 +1,154 @@
+import argparse
+import os
+import shutil
+import sqlite3
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from analytics_backends import columnar_directory
+from generations import new_version, publish_generation, remove_old_versions, resolve_database
+
+# Playlists (and their tracks) are partitioned into buckets of this many pids
+PARTITION_SIZE = 100_000
+BATCH_SIZE = 100_000
+
+PLAYLISTS_SCHEMA = pa.schema([
+    ('pid', pa.int64()),
+    ('name', pa.string()),
+    ('collaborative', pa.bool_()),
+    ('modified_at', pa.string()),
+    ('num_tracks', pa.int64()),
+    ('num_albums', pa.int64()),
+    ('num_followers', pa.int64()),
+    ('bucket', pa.int64()),
+])
+
+TRACKS_SCHEMA = pa.schema([
+    ('track_uri', pa.string()),
+    ('playlist_id', pa.int64()),
+    ('pos', pa.int64()),
+    ('track_name', pa.string()),
+    ('artist_name', pa.string()),
+    ('artist_uri', pa.string()),
+    ('album_uri', pa.string()),
+    ('album_name', pa.string()),
+    ('duration_ms', pa.int64()),
+    ('bucket', pa.int64()),
+])
+
+
+FEATURES_SCHEMA = pa.schema([
+    ('pid', pa.int64()),
+    ('track_count', pa.int64()),
+    ('artist_count', pa.int64()),
+    ('album_count', pa.int64()),
+    ('total_duration_ms', pa.int64()),
+    ('avg_duration_ms', pa.float64()),
+    ('follower_bucket', pa.int64()),
+    ('bucket', pa.int64()),
+])
+
+
+TOP_TRACKS_SCHEMA = pa.schema([
+    ('artist_name', pa.string()),
+    ('track_rank', pa.int64()),
+    ('track_name', pa.string()),
+    ('track_count', pa.int64()),
+    ('bucket', pa.int64()),
+])
+
+
+def _batches(connection, query, schema):
+    """Stream query results as Arrow record batches without loading the table."""
+    cursor = connection.cursor()
+    cursor.execute(query, (PARTITION_SIZE,))
+    names = schema.names
+    while True:
+        rows = cursor.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        columns = list(zip(*rows))
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(column).cast(schema.field(name).type) for name, column in zip(names, columns)],
+            schema=schema,
+        )
+    cursor.close()
+
+
+def export_table(connection, query, schema, directory):
+    """Write query results (ordered by bucket) as a hive-partitioned Parquet dataset."""
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    file_schema = schema.remove(schema.get_field_index('bucket'))
+    writer = None
+    current_bucket = None
+    try:
+        for batch in _batches(connection, query, schema):
+            for bucket in pc.unique(batch['bucket']).to_pylist():
+                if bucket != current_bucket:
+                    if writer:
+                        writer.close()
+                    bucket_directory = os.path.join(directory, f'bucket={bucket}')
+                    os.makedirs(bucket_directory, exist_ok=True)
+                    writer = pq.ParquetWriter(os.path.join(bucket_directory, 'part-0.parquet'), file_schema)
+                    current_bucket = bucket
+                rows = batch.filter(pc.equal(batch['bucket'], bucket)).drop_columns(['bucket'])
+                writer.write_batch(rows)
+    finally:
+        if writer:
+            writer.close()
+
+
+def export_database(connection, directory):
+    """Write Playlists, Tracks, PlaylistFeatures and ArtistTopTracks as Parquet datasets partitioned by pid bucket.
+
+    The datasets go into a new version of directory, published in one rename
+    like the artist graph, so DuckDB never reads a half-written export.
+    """
+    published = directory
+    directory = new_version(published)
+    export_table(connection, '''
+        SELECT pid, name, collaborative = 1, modified_at, num_tracks, num_albums, num_followers, pid / ?
+        FROM Playlists
+        ORDER BY pid
+    ''', PLAYLISTS_SCHEMA, os.path.join(directory, 'playlists'))
+    export_table(connection, '''
+        SELECT track_uri, playlist_id, pos, track_name, artist_name, artist_uri, album_uri, album_name,
+               duration_ms, playlist_id / ?
+        FROM Tracks
+        ORDER BY playlist_id
+    ''', TRACKS_SCHEMA, os.path.join(directory, 'tracks'))
+    export_table(connection, '''
+        SELECT pid, track_count, artist_count, album_count, total_duration_ms, avg_duration_ms,
+               follower_bucket, pid / ?
+        FROM PlaylistFeatures
+        ORDER BY pid
+    ''', FEATURES_SCHEMA, os.path.join(directory, 'playlist_features'))
+    # Not keyed by pid, and small: written as a single partition
+    export_table(connection, '''
+        SELECT artist_name, track_rank, track_name, track_count, 0 * ?
+        FROM ArtistTopTracks
+    ''', TOP_TRACKS_SCHEMA, os.path.join(directory, 'artist_top_tracks'))
+    publish_generation(published, directory)
+    remove_old_versions(published)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export Playlists, Tracks, PlaylistFeatures and ArtistTopTracks to partitioned Parquet files.")
+    parser.add_argument("--database", default=os.environ.get('RECOMMENDATION_DB', 'recommendation.db'))
+    parser.add_argument("--output", help="Export directory (default: next to the published catalog generation)")
+    args = parser.parse_args()
+
+    # Exported from the catalog generation currently published for the database
+    catalog = resolve_database(args.database)
+    output = args.output or columnar_directory(catalog)
+    connection = sqlite3.connect(f"file:{catalog}?mode=ro", uri=True)
+    export_database(connection, output)
+    connection.close()
+    print(f"Exported Playlists, Tracks, PlaylistFeatures and ArtistTopTracks from {catalog} to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# scrypt cost: N=2**14, r=8 uses 16 MiB and takes tens of milliseconds per hash.
+# Stored hashes record their parameters, so raising these rehashes users on their next login.
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+# Hashes computed at once (hashlib.scrypt releases the GIL, so they run in parallel
+# without stalling page renders) and the most logins allowed to wait for one
+KDF_WORKERS = min(4, os.cpu_count() or 1)
+MAX_PENDING = KDF_WORKERS * 16
+
+# A username is locked out after this many failed logins within the window
+MAX_FAILURES = 5
+FAILURE_WINDOW = 300
+
+_pool = ThreadPoolExecutor(max_workers=KDF_WORKERS, thread_name_prefix='kdf')
+_pending = threading.BoundedSemaphore(MAX_PENDING)
+
+
+class CredentialsBusy(Exception):
+    """Raised when too many logins are already waiting for the KDF."""
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=2 * 128 * r * (n + p + 2), dklen=KEY_BYTES)
+
+
+def _hash(password):
+    salt = os.urandom(SALT_BYTES)
+    key = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${key.hex()}"
+
+
+def _verify(password, stored):
+    """Return (matches, replacement hash or None) for a stored hash."""
+    if stored is None:
+        # Unknown user: spend the same time as a real check so usernames can't be probed
+        _hash(password)
+        return False, None
+    try:
+        if stored.startswith('scrypt$'):
+            _, n, r, p, salt, key = stored.split('$')
+            n, r, p = int(n), int(r), int(p)
+            matches = hmac.compare_digest(_scrypt(password, bytes.fromhex(salt), n, r, p), bytes.fromhex(key))
+            outdated = (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        else:
+            # Legacy unsalted SHA-256 hex digest
+            matches = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+            outdated = True
+    except (ValueError, TypeError):
+        # A malformed stored hash (bad fields, non-hex or non-ASCII text) is a failed login, not a crash
+        _hash(password)
+        return False, None
+    return matches, (_hash(password) if matches and outdated else None)
+
+
+def _run(function, *args):
+    if not _pending.acquire(timeout=5):
+        raise CredentialsBusy("Too many logins in progress")
+    try:
+        return _pool.submit(function, *args).result()
+    finally:
+        _pending.release()
+
+
+def hash_password(password):
+    """Salted scrypt hash of password, formatted as scrypt$n$r$p$salt$key."""
+    return _run(_hash, password)
+
+
+def verify_password(password, stored):
+    """Check password against a stored scrypt or legacy SHA-256 hash (None for unknown users).
+
+    Returns (matches, new_hash): new_hash is set when the password matched a
+    legacy or weaker hash and should replace it.
+    """
+    return _run(_verify, password, stored)
+
+
+class FailureLimiter:
+    """Counts failed logins per username over a sliding window."""
+
+    def __init__(self, max_failures=MAX_FAILURES, window=FAILURE_WINDOW):
+        self.max_failures = max_failures
+        self.window = window
+        self.failures = {}
+        self.lock = threading.Lock()
+
+    def _recent(self, username, now):
+        failures = self.failures.get(username)
+        if failures is None:
+            return None
+        while failures and failures[0] <= now - self.window:
+            failures.popleft()
+        if not failures:
+            del self.failures[username]
+            return None
+        return failures
+
+    def retry_after(self, username):
+        """Seconds until username may try again, or 0 if it is not locked out."""
+        now = time.monotonic()
+        with self.lock:
+            failures = self._recent(username, now)
+            if failures is None or len(failures) < self.max_failures:
+                return 0
+            return failures[-self.max_failures] + self.window - now
+
+    def record_failure(self, username):
+        now = time.monotonic()
+        with self.lock:
+            failures = self._recent(username, now)
+            if failures is None:
+                failures = self.failures[username] = deque(maxlen=self.max_failures)
+            failures.append(now)
+
+    def reset(self, username):
+        with self.lock:
+            self.failures.pop(username, None)
+
+
+login_limiter = FailureLimiter()
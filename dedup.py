@@ -0,0 +1,83 @@
+import hashlib
+import math
+
+# Keys remembered exactly before switching to a Bloom filter (about 110 bytes each).
+# The full MPD has about 2.3M unique track_uris (about 250 MiB as a set), so real
+# imports stay exact; the filter is only an overflow for larger catalogs, since
+# every hit it reports costs a point lookup and seeding it hashes in Python
+EXACT_LIMIT = 5_000_000
+BLOOM_ERROR_RATE = 0.01
+
+NEW = 'new'
+SEEN = 'seen'
+MAYBE = 'maybe'
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys."""
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, key):
+        """Add key and return whether it may have been added before."""
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        present = True
+        for i in range(self.hashes):
+            position = (h1 + i * h2) % self.size
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not self.bits[byte] & bit:
+                present = False
+                self.bits[byte] |= bit
+        return present
+
+
+class SeenKeys:
+    """Remembers which keys were already stored during an ingest.
+
+    Keys are kept in an exact set until there are more than exact_limit of
+    them, then in a Bloom filter sized for bloom_capacity keys. add() answers
+    NEW (certainly not seen), SEEN (certainly seen; exact mode only) or MAYBE
+    (a Bloom filter hit, which the caller still has to verify).
+    """
+
+    def __init__(self, exact_limit=EXACT_LIMIT, bloom_capacity=None):
+        self.exact_limit = exact_limit
+        self.bloom_capacity = bloom_capacity
+        self.keys = set()
+        self.bloom = None
+
+    @property
+    def exact(self):
+        return self.bloom is None
+
+    def add(self, key):
+        if self.bloom is None:
+            if key in self.keys:
+                return SEEN
+            self.keys.add(key)
+            if len(self.keys) > self.exact_limit:
+                self._switch_to_bloom()
+            return NEW
+        return MAYBE if self.bloom.add(key) else NEW
+
+    def _switch_to_bloom(self):
+        self.bloom = BloomFilter(max(self.bloom_capacity or 0, 4 * len(self.keys)))
+        for key in self.keys:
+            self.bloom.add(key)
+        self.keys = set()
+
+    @classmethod
+    def from_database(cls, connection, query, **kwargs):
+        """Seed with the keys a table already holds, e.g. SELECT track_uri FROM Tracks."""
+        seen = cls(**kwargs)
+        cursor = connection.cursor()
+        cursor.execute(query)
+        for (key,) in cursor:
+            seen.add(key)
+        cursor.close()
+        return seen
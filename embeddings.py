@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+from array import array
+
+import numpy as np
+
+from generations import new_version, publish_generation, remove_old_versions, resolve_database
+from slice_reader import iter_slices
+
+EMBEDDING_DIRECTORY = 'track_embeddings'
+
+DIMENSIONS = 64
+# Tracks in fewer playlists than this have no co-occurrence signal to factorize
+MIN_PLAYLISTS = 2
+# Inverted lists scanned per query; more lists means better recall and slower queries
+N_PROBE = 16
+
+
+def _normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (vectors / norms).astype(np.float32)
+
+
+def build_ivf(vectors, n_lists=None, iterations=10, seed=0):
+    """Cluster unit vectors with spherical k-means and return (centroids, list_indptr, list_ids).
+
+    list_ids holds the track ids ordered by cluster; list_indptr[c]:list_indptr[c + 1]
+    is the slice belonging to centroid c.
+    """
+    n = len(vectors)
+    n_lists = n_lists or max(1, int(np.sqrt(n)))
+    rng = np.random.default_rng(seed)
+    sample = vectors[np.sort(rng.choice(n, min(n, n_lists * 64), replace=False))]
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        filled = np.bincount(assignments, minlength=n_lists) > 0
+        centroids[filled] = _normalize_rows(sums[filled])
+
+    assignments = np.empty(n, dtype=np.int32)
+    for start in range(0, n, 65536):
+        assignments[start:start + 65536] = np.argmax(vectors[start:start + 65536] @ centroids.T, axis=1)
+    list_ids = np.argsort(assignments, kind='stable').astype(np.int32)
+    list_indptr = np.zeros(n_lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignments, minlength=n_lists), out=list_indptr[1:])
+    return centroids, list_indptr, list_ids
+
+
+class EmbeddingBuilder:
+    """Collects the playlist x track matrix one playlist at a time."""
+
+    def __init__(self):
+        self.track_ids = {}
+        self.track_names = []
+        self.track_artists = []
+        self.columns = array('i')
+        self.lengths = array('i')
+
+    def add_playlists(self, playlists):
+        for playlist in playlists:
+            self.add_playlist(playlist)
+
+    def add_playlist(self, playlist):
+        ids = set()
+        for track in playlist["tracks"]:
+            track_id = self.track_ids.get(track["track_uri"])
+            if track_id is None:
+                track_id = self.track_ids[track["track_uri"]] = len(self.track_ids)
+                self.track_names.append(track["track_name"])
+                self.track_artists.append(track["artist_name"])
+            ids.add(track_id)
+        self.columns.extend(ids)
+        self.lengths.append(len(ids))
+
+    def build(self, dimensions=DIMENSIONS, min_playlists=MIN_PLAYLISTS):
+        """Factorize the matrix with truncated SVD and index the track vectors."""
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.linalg import svds
+
+        columns = np.frombuffer(self.columns, dtype=np.int32)
+        lengths = np.frombuffer(self.lengths, dtype=np.int32)
+        n_playlists = len(lengths)
+        counts = np.bincount(columns, minlength=len(self.track_ids))
+        kept = np.flatnonzero(counts >= min_playlists)
+        remap = np.full(len(counts), -1, dtype=np.int32)
+        remap[kept] = np.arange(len(kept), dtype=np.int32)
+
+        rows = np.repeat(np.arange(n_playlists, dtype=np.int32), lengths)
+        mask = remap[columns] >= 0
+        rows, cols = rows[mask], remap[columns[mask]]
+        # IDF weights damp the globally popular tracks that dominate raw co-occurrence
+        idf = np.log(n_playlists / counts[kept]).astype(np.float32)
+        matrix = csr_matrix((idf[cols], (rows, cols)), shape=(n_playlists, len(kept)), dtype=np.float32)
+        row_norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        row_norms[row_norms == 0] = 1
+        matrix = csr_matrix(matrix.multiply(1 / row_norms[:, None]))
+
+        k = min(dimensions, min(matrix.shape) - 1)
+        _, singular, vt = svds(matrix, k=k, random_state=0)
+        vectors = _normalize_rows(vt.T * np.sqrt(singular))
+
+        uris = list(self.track_ids)  # insertion order is id order
+        artists, track_artist = np.unique([self.track_artists[i] for i in kept], return_inverse=True)
+        artist_vectors = np.zeros((len(artists), vectors.shape[1]), dtype=np.float32)
+        np.add.at(artist_vectors, track_artist, vectors)
+
+        return TrackEmbeddings(
+            [uris[i] for i in kept],
+            [self.track_names[i] for i in kept],
+            artists.tolist(),
+            vectors,
+            track_artist.astype(np.int32),
+            _normalize_rows(artist_vectors),
+            *build_ivf(vectors),
+        )
+
+
+class TrackEmbeddings:
+    """Unit-length track and artist vectors with an IVF index for top-k cosine search."""
+
+    ARRAYS = ('vectors', 'track_artist', 'artist_vectors', 'centroids', 'list_indptr', 'list_ids')
+
+    def __init__(self, track_uris, track_names, artists, vectors, track_artist, artist_vectors,
+                 centroids, list_indptr, list_ids):
+        self.track_uris = track_uris
+        self.track_names = track_names
+        self.artists = artists
+        self.artist_ids = {name: i for i, name in enumerate(artists)}
+        self.vectors = vectors
+        self.track_artist = track_artist
+        self.artist_vectors = artist_vectors
+        self.centroids = centroids
+        self.list_indptr = list_indptr
+        self.list_ids = list_ids
+        self._uri_ids = None
+
+    def track_id(self, track_uri):
+        if self._uri_ids is None:
+            self._uri_ids = {uri: i for i, uri in enumerate(self.track_uris)}
+        return self._uri_ids.get(track_uri)
+
+    def search(self, query, k=10, n_probe=N_PROBE, excluded_artists=()):
+        """Approximate top-k track ids and scores by cosine similarity to query."""
+        n_probe = min(n_probe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        candidates = np.concatenate([self.list_ids[self.list_indptr[c]:self.list_indptr[c + 1]] for c in probe])
+        if len(excluded_artists):
+            candidates = candidates[~np.isin(self.track_artist[candidates], excluded_artists)]
+        if len(candidates) == 0:
+            return []
+        scores = self.vectors[candidates] @ query
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+    def _describe(self, results):
+        return [(self.track_names[i], self.artists[self.track_artist[i]], score) for i, score in results]
+
+    def similar_tracks(self, track_uri, k=10):
+        """Tracks whose playlists look most like those of track_uri: (track, artist, score)."""
+        track_id = self.track_id(track_uri)
+        if track_id is None:
+            return []
+        results = self.search(self.vectors[track_id], k + 1)
+        return self._describe([(i, score) for i, score in results if i != track_id][:k])
+
+    def recommend_for_artists(self, favorite_artists, k=10):
+        """Tracks by other artists closest to the mean of the favorites' artist vectors."""
+        favorite_ids = [self.artist_ids[name] for name in favorite_artists if name in self.artist_ids]
+        if not favorite_ids:
+            return []
+        query = self.artist_vectors[favorite_ids].sum(axis=0)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        return self._describe(self.search(query / norm, k, excluded_artists=np.array(favorite_ids)))
+
+    def save(self, directory=None):
+        """Write the embeddings into a new version of directory and publish it in one rename."""
+        directory = directory or EMBEDDING_DIRECTORY
+        # Same scheme as the artist graph
+        version = new_version(directory)
+        for name in self.ARRAYS:
+            with open(os.path.join(version, f'{name}.npy'), 'wb') as f:
+                np.save(f, getattr(self, name))
+        with open(os.path.join(version, 'tracks.json'), 'w') as f:
+            json.dump({'uris': self.track_uris, 'names': self.track_names, 'artists': self.artists}, f)
+        publish_generation(directory, version)
+        remove_old_versions(directory)
+
+    @classmethod
+    def load(cls, directory):
+        """Open a saved version; the vector arrays are memory-mapped, not read into memory."""
+        with open(os.path.join(directory, 'tracks.json')) as f:
+            tracks = json.load(f)
+        arrays = [np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in cls.ARRAYS]
+        return cls(tracks['uris'], tracks['names'], tracks['artists'], *arrays)
+
+
+_loaded_embeddings = {}
+
+
+def load_embeddings(directory=None):
+    """Return the published embeddings of directory, reloading them if they were rebuilt, or None."""
+    directory = directory or EMBEDDING_DIRECTORY
+    version = resolve_database(directory)
+    cached = _loaded_embeddings.get(directory)
+    if cached is None or cached[0] != version:
+        if not os.path.exists(os.path.join(version, 'tracks.json')):
+            return None
+        try:
+            embeddings = TrackEmbeddings.load(version)
+        except FileNotFoundError:
+            # Rebuilt twice while it was being opened, so its version was removed; open the newest
+            return load_embeddings(directory)
+        cached = _loaded_embeddings[directory] = (version, embeddings)
+    return cached[1]
+
+
+def build_from_files(inputs, dimensions=DIMENSIONS):
+    """Build embeddings from MPD slices: .json, .json.gz or .json.zst files or .zip archives (paths or globs).
+
+    They are read from the JSON rather than Tracks because Tracks keeps each
+    track_uri for one playlist only, which leaves no co-occurrence to factorize.
+    """
+    builder = EmbeddingBuilder()
+    for name, playlists in iter_slices(inputs):
+        builder.add_playlists(playlists)
+    return builder.build(dimensions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build track embeddings and their nearest-neighbor index.")
+    parser.add_argument("--data", nargs="+", default=["data/*.json"],
+                        help="Slice files, globs or archives: *.json, *.json.gz, *.json.zst or the MPD .zip")
+    parser.add_argument("--output", default=EMBEDDING_DIRECTORY)
+    parser.add_argument("--dimensions", type=int, default=DIMENSIONS)
+    args = parser.parse_args()
+
+    embeddings = build_from_files(args.data, args.dimensions)
+    embeddings.save(args.output)
+    print(f"Saved {len(embeddings.track_uris)} track vectors ({embeddings.vectors.shape[1]} dimensions) "
+          f"in {len(embeddings.centroids)} lists to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+import query_registry
+from embeddings import EMBEDDING_DIRECTORY, load_embeddings
+from generations import resolve_database
+from slice_reader import iter_slices
+
+DATABASE = os.environ.get('RECOMMENDATION_DB', 'recommendation.db')
+
+# Playlists scored per task sent to a worker
+CHUNK_SIZE = 50
+
+BACKENDS = ('cooccurrence', 'embeddings', 'popularity')
+
+# Per-process state of the pool workers, set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(database, embedding_directory, popular):
+    _worker['connection'] = sqlite3.connect(f"file:{resolve_database(database)}?mode=ro", uri=True)
+    _worker['embeddings'] = load_embeddings(embedding_directory)
+    _worker['popular'] = popular
+
+
+def recommend_cooccurrence(seeds, seed_artists, k):
+    """Tracks that share playlists with the seed artists, as get_recommended_tracks ranks them."""
+    connection = _worker['connection']
+    query_registry.load_favorite_set(connection, seed_artists)
+    rows = connection.execute(query_registry.QUERIES['get_recommended_tracks'], (k,))
+    return [(track, artist) for track, artist, count in rows]
+
+
+def recommend_embeddings(seeds, seed_artists, k):
+    """Tracks closest to the seed artists in the embedding space, as get_similar_tracks ranks them."""
+    return [(track, artist) for track, artist, score in _worker['embeddings'].recommend_for_artists(seed_artists, k)]
+
+
+def recommend_popularity(seeds, seed_artists, k):
+    """The most frequent tracks outside the sampled playlists, minus the seeds."""
+    seeds = set(seeds)
+    return [track for track in _worker['popular'] if track not in seeds][:k]
+
+
+RECOMMENDERS = {
+    'cooccurrence': recommend_cooccurrence,
+    'embeddings': recommend_embeddings,
+    'popularity': recommend_popularity,
+}
+
+
+def r_precision(recommended, held_out):
+    """Share of the held-out tracks among the first len(held_out) recommendations."""
+    return len(held_out.intersection(recommended[:len(held_out)])) / len(held_out)
+
+
+def ndcg(recommended, held_out, k):
+    """Normalized discounted cumulative gain of the first k recommendations."""
+    dcg = sum(1 / math.log2(rank + 2) for rank, track in enumerate(recommended[:k]) if track in held_out)
+    ideal = sum(1 / math.log2(rank + 2) for rank in range(min(len(held_out), k)))
+    return dcg / ideal
+
+
+def recall(recommended, held_out, k):
+    return len(held_out.intersection(recommended[:k])) / len(held_out)
+
+
+def _score_chunk(playlists, backends, ks):
+    """Ask every backend to continue each playlist; return one score row per playlist and backend."""
+    rows = []
+    for seeds, held_out in playlists:
+        seed_artists = list(dict.fromkeys(artist for track, artist in seeds))
+        held_out = set(held_out)
+        for backend in backends:
+            start = time.perf_counter()
+            recommended = RECOMMENDERS[backend](seeds, seed_artists, max(ks))
+            seconds = time.perf_counter() - start
+            rows.append({
+                'backend': backend,
+                'seconds': seconds,
+                'recommended': len(recommended),
+                'r_precision': r_precision(recommended, held_out),
+                'ndcg': ndcg(recommended, held_out, max(ks)),
+                'recall': {k: recall(recommended, held_out, k) for k in ks},
+            })
+    return rows
+
+
+def sample_playlists(inputs, count, seed_tracks, rng):
+    """Reservoir-sample count playlists with more than seed_tracks tracks from the slices.
+
+    Returns (sampled playlists as (pid, seeds, held-out tracks), track counts of
+    every other playlist). Tracks are (track name, artist name) pairs, the
+    form the recommenders return.
+    """
+    sampled = []
+    counts = Counter()
+    seen = 0
+    for name, playlists in iter_slices(inputs):
+        for playlist in playlists:
+            tracks = [(track['track_name'], track['artist_name']) for track in playlist['tracks']]
+            counts.update(tracks)
+            if len(tracks) <= seed_tracks:
+                continue
+            seen += 1
+            if len(sampled) < count:
+                sampled.append((playlist['pid'], tracks))
+            else:
+                index = rng.randrange(seen)
+                if index < count:
+                    sampled[index] = (playlist['pid'], tracks)
+    # Popularity must not see the tracks it is asked to predict
+    for pid, tracks in sampled:
+        counts.subtract(tracks)
+    return [(pid, tracks[:seed_tracks], list(dict.fromkeys(tracks[seed_tracks:]))) for pid, tracks in sampled], counts
+
+
+def count_in_catalog(database, pids):
+    """Sampled playlists that are also in the catalog, whose held-out tracks it has seen."""
+    connection = sqlite3.connect(f"file:{resolve_database(database)}?mode=ro", uri=True)
+    try:
+        return connection.execute('SELECT COUNT(*) FROM Playlists WHERE pid IN (SELECT value FROM json_each(?))',
+                                  (json.dumps(pids),)).fetchone()[0]
+    finally:
+        connection.close()
+
+
+def summarize(rows, backend, ks):
+    rows = [row for row in rows if row['backend'] == backend]
+    latencies = np.array([row['seconds'] for row in rows]) * 1000
+    return {
+        'playlists': len(rows),
+        'r_precision': float(np.mean([row['r_precision'] for row in rows])),
+        'ndcg': float(np.mean([row['ndcg'] for row in rows])),
+        'recall': {k: float(np.mean([row['recall'][k] for row in rows])) for k in ks},
+        'empty': sum(1 for row in rows if row['recommended'] == 0),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'mean_ms': float(latencies.mean()),
+    }
+
+
+def evaluate(inputs, database=None, backends=BACKENDS, sample=1000, seed_tracks=5, ks=(10, 100, 500),
+             workers=None, embedding_directory=None, seed=0):
+    """Hold out all but the first seed_tracks tracks of sampled playlists and score each
+    backend's continuations in a process pool; return the report."""
+    database = database or DATABASE
+    embedding_directory = embedding_directory or EMBEDDING_DIRECTORY
+    ks = sorted(set(ks))
+    backends = list(backends)
+    if 'embeddings' in backends and load_embeddings(embedding_directory) is None:
+        print(f"No embeddings in {embedding_directory}; skipping the embeddings backend")
+        backends.remove('embeddings')
+
+    start = time.perf_counter()
+    playlists, counts = sample_playlists(inputs, sample, seed_tracks, random.Random(seed))
+    if not playlists:
+        raise SystemExit(f"No playlists with more than {seed_tracks} tracks in {inputs}")
+    popular = [track for track, count in counts.most_common(max(ks) + seed_tracks) if count > 0]
+    in_catalog = count_in_catalog(database, [pid for pid, seeds, held_out in playlists])
+    sampling_seconds = time.perf_counter() - start
+
+    tasks = [[(seeds, held_out) for pid, seeds, held_out in playlists[i:i + CHUNK_SIZE]]
+             for i in range(0, len(playlists), CHUNK_SIZE)]
+    start = time.perf_counter()
+    # spawn, so workers never inherit open SQLite connections or threads
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                             mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker,
+                             initargs=(database, embedding_directory, popular)) as pool:
+        rows = [row for chunk in pool.map(_score_chunk, tasks, [backends] * len(tasks), [ks] * len(tasks))
+                for row in chunk]
+    scoring_seconds = time.perf_counter() - start
+
+    return {
+        'created_at': datetime.now().isoformat(),
+        'database': database,
+        'playlists': len(playlists),
+        'in_catalog': in_catalog,
+        'seed_tracks': seed_tracks,
+        'held_out_tracks': sum(len(held_out) for pid, seeds, held_out in playlists),
+        'sampling_seconds': sampling_seconds,
+        'scoring_seconds': scoring_seconds,
+        'backends': {backend: summarize(rows, backend, ks) for backend in backends},
+    }
+
+
+def print_report(report):
+    print(f"{report['playlists']} playlists, {report['seed_tracks']} seed tracks each, "
+          f"{report['held_out_tracks']} held-out tracks; scored in {report['scoring_seconds']:.1f} s")
+    if report['in_catalog']:
+        print(f"Warning: {report['in_catalog']} of the sampled playlists are in the catalog, so the co-occurrence "
+              f"and embeddings scores are optimistic. Build them without the evaluation slices for a fair measure.")
+    for backend, summary in report['backends'].items():
+        recalls = "  ".join(f"recall@{k} {value:.4f}" for k, value in summary['recall'].items())
+        print(f"{backend:>13}: R-precision {summary['r_precision']:.4f}  NDCG {summary['ndcg']:.4f}  {recalls}  "
+              f"p50 {summary['p50_ms']:.1f} ms  p95 {summary['p95_ms']:.1f} ms  empty {summary['empty']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score playlist continuations from each recommender on held-out tracks.")
+    parser.add_argument("inputs", nargs="*", default=["data/*.json"],
+                        help="Slices to sample playlists from: *.json, *.json.gz, *.json.zst or the MPD .zip")
+    parser.add_argument("--database", default=DATABASE)
+    parser.add_argument("--embeddings", default=EMBEDDING_DIRECTORY, help="Embedding directory from embeddings.py")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--sample", type=int, default=1000, help="Playlists to evaluate")
+    parser.add_argument("--seed-tracks", type=int, default=5, help="Tracks given to the recommender; the rest are held out")
+    parser.add_argument("--k", type=int, nargs="+", default=[10, 100, 500], help="Cutoffs for recall; NDCG uses the largest")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    report = evaluate(args.inputs, args.database, args.backends, args.sample, args.seed_tracks, args.k,
+                      args.workers, args.embeddings, args.seed)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote the report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import glob
+import os
+import shutil
+import time
+
+# The catalog (Playlists, Tracks and everything derived from them) is read from
+# DATABASE itself until snapshot.py publishes a generation. From then on the
+# pointer file DATABASE + POINTER_SUFFIX holds the name of the generation file,
+# next to DATABASE, that serves it. The user tables always stay in DATABASE.
+POINTER_SUFFIX = '.current'
+
+# Versions of a derived-file directory kept on disk, including the published one, so a
+# reader that resolved the previous pointer can still open its files
+KEEP_VERSIONS = 2
+
+# database -> ((pointer mtime, inode), generation path)
+_resolved = {}
+
+
+def pointer_path(database):
+    return database + POINTER_SUFFIX
+
+
+def resolve_database(database):
+    """Path of the catalog generation currently published for database, or database itself.
+
+    Costs one stat() per call, so connections can resolve it every time they
+    open and pick up a new generation as soon as it is published.
+    """
+    try:
+        stat = os.stat(pointer_path(database))
+    except FileNotFoundError:
+        return database
+    # The pointer is replaced by rename, so a new generation always has a new inode
+    key = (stat.st_mtime_ns, stat.st_ino)
+    cached = _resolved.get(database)
+    if cached is None or cached[0] != key:
+        with open(pointer_path(database)) as f:
+            name = f.read().strip()
+        cached = _resolved[database] = (key, os.path.join(os.path.dirname(database), name))
+    return cached[1]
+
+
+def require_unpublished(database):
+    """Exit if database already serves published generations, which must never be modified.
+
+    Tools that write catalog tables call this first; a published catalog is
+    rebuilt with snapshot.py instead.
+    """
+    if os.path.exists(pointer_path(database)):
+        raise SystemExit(f"{database} serves published catalog generations; rebuild it with snapshot.py instead")
+
+
+def publish_generation(database, generation):
+    """Atomically make generation (a file in database's directory) the published catalog."""
+    pointer = pointer_path(database)
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(os.path.basename(generation) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer + '.tmp', pointer)
+    # Make the rename itself durable
+    directory = os.open(os.path.dirname(os.path.abspath(pointer)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+# Directories of derived files (the artist graph, the embeddings) are versioned the
+# same way: each save fills a new directory next to directory and publishes it with
+# publish_generation(directory, version), so readers never see a half-written set
+# of arrays; resolve_database(directory) gives the version to read.
+
+def new_version(directory):
+    """Create an empty version directory next to directory, named so that newer versions sort last."""
+    # Both parts come from one clock reading, in UTC so the names keep their
+    # order across a daylight-saving change
+    seconds, nanoseconds = divmod(time.time_ns(), 10 ** 9)
+    path = f"{os.path.abspath(directory)}.{time.strftime('%Y%m%d-%H%M%S', time.gmtime(seconds))}.{nanoseconds:09d}"
+    os.makedirs(path)
+    return path
+
+
+def list_versions(directory):
+    """Version directories of directory, oldest first."""
+    parent, name = os.path.split(os.path.abspath(directory))
+    paths = glob.glob(os.path.join(glob.escape(parent), glob.escape(name) + '.*'))
+    return sorted(path for path in paths if os.path.isdir(path))
+
+
+def remove_old_versions(directory, keep=KEEP_VERSIONS):
+    """Delete all but the newest keep versions of directory; the published one is never deleted."""
+    current = os.path.abspath(resolve_database(directory))
+    versions = list_versions(directory)
+    for path in versions[:max(len(versions) - keep, 0)]:
+        if path != current:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def remove_versions(directory):
+    """Delete every version of directory and its pointer, e.g. with the generation they belong to."""
+    for path in list_versions(directory):
+        shutil.rmtree(path, ignore_errors=True)
+    if os.path.exists(pointer_path(directory)):
+        os.remove(pointer_path(directory))
+    _resolved.pop(directory, None)
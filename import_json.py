@@ -1,12 +1,24 @@
+import argparse
 import json
+import os
 import sqlite3
 from datetime import datetime
-import glob
+
+from approximate_queries import SketchBuilder
+from artist_top_tracks import create_top_tracks_table, refresh_top_tracks
+from artist_graph import build_from_database, graph_directory
+from dedup import MAYBE, SEEN, SeenKeys
+from generations import require_unpublished
+from playlist_features import create_features_table, refresh_features
+from slice_reader import iter_slices
+from trending_queries import create_trending_tables, tracks_watermark, update_monthly_counts
+
+DATABASE = os.environ.get('RECOMMENDATION_DB', 'recommendation.db')
 
 def create_connection():
     connection = None
     try:
-        connection = sqlite3.connect('recommendation.db')
+        connection = sqlite3.connect(DATABASE)
         return connection
     except sqlite3.Error as e:
         print(f"Error: '{e}'")
@@ -42,20 +54,60 @@ def create_tables():
             FOREIGN KEY (playlist_id) REFERENCES Playlists(pid)
         )
         ''')
+        # Used by the favorite-artist joins in query_registry and most analytics queries
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tracks_artist_name ON Tracks(artist_name)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tracks_playlist_id ON Tracks(playlist_id)')
         
         connection.commit()
         cursor.close()
+        create_features_table(connection)
+        create_trending_tables(connection)
+        create_top_tracks_table(connection)
         connection.close()
 
-def insert_data(connection, combined_data):
+def unstored_playlists(connection, playlists):
+    """The playlists whose pid is not in Playlists yet."""
+    stored = {row[0] for row in connection.execute(
+        'SELECT pid FROM Playlists WHERE pid IN (SELECT value FROM json_each(?))',
+        (json.dumps([playlist["pid"] for playlist in playlists]),))}
+    return [playlist for playlist in playlists if playlist["pid"] not in stored]
+
+def stored_playlists(connection, after_rowid):
+    """The Tracks rows inserted after after_rowid, grouped into playlists shaped like the slice JSON.
+
+    The sketches are built from these rather than the JSON, so they estimate
+    the same deduplicated Tracks that the exact queries count.
+    """
+    playlists = {}
+    for pid, name, num_followers, track_name, artist_name, album_name in connection.execute('''
+        SELECT p.pid, p.name, p.num_followers, t.track_name, t.artist_name, t.album_name
+        FROM Tracks t
+        JOIN Playlists p ON p.pid = t.playlist_id
+        WHERE t.rowid > ?
+    ''', (after_rowid,)):
+        playlist = playlists.get(pid)
+        if playlist is None:
+            playlist = playlists[pid] = {"name": name, "num_followers": num_followers, "tracks": []}
+        playlist["tracks"].append({"track_name": track_name, "artist_name": artist_name, "album_name": album_name})
+    return list(playlists.values())
+
+def insert_data(connection, combined_data, seen_tracks=None):
+    """Insert playlists and their tracks; the caller commits them.
+
+    With seen_tracks (a dedup.SeenKeys of the track_uris already stored),
+    tracks known to be duplicates are skipped without touching the Tracks
+    index. Bloom filter hits are confirmed with a point lookup first.
+    Returns (track rows in the data, duplicate rows skipped).
+    """
     cursor = connection.cursor()
     
+    playlist_rows = []
+    track_rows = []
+    # track_uris queued in this call, which the point lookups cannot see yet
+    queued = set()
+    total_tracks = 0
     for playlist in combined_data:
-        playlist_query = '''
-        INSERT OR IGNORE INTO Playlists (pid, name, collaborative, modified_at, num_tracks, num_albums, num_followers)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        '''
-        playlist_values = (
+        playlist_rows.append((
             playlist["pid"],
             playlist["name"],
             playlist["collaborative"] == "true",
@@ -63,15 +115,19 @@ def insert_data(connection, combined_data):
             playlist["num_tracks"],
             playlist["num_albums"],
             playlist["num_followers"]
-        )
-        cursor.execute(playlist_query, playlist_values)
+        ))
         
         for track in playlist["tracks"]:
-            track_query = '''
-            INSERT OR IGNORE INTO Tracks (track_uri, playlist_id, pos, track_name, artist_name, artist_uri, album_uri, album_name, duration_ms)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            '''
-            track_values = (
+            total_tracks += 1
+            if seen_tracks is not None:
+                state = seen_tracks.add(track["track_uri"])
+                if state == SEEN:
+                    continue
+                if state == MAYBE and (track["track_uri"] in queued or cursor.execute(
+                        'SELECT 1 FROM Tracks WHERE track_uri = ?', (track["track_uri"],)).fetchone()):
+                    continue
+                queued.add(track["track_uri"])
+            track_rows.append((
                 track["track_uri"],
                 playlist["pid"],
                 track["pos"],
@@ -81,30 +137,86 @@ def insert_data(connection, combined_data):
                 track["album_uri"],
                 track["album_name"],
                 track["duration_ms"]
-            )
-            cursor.execute(track_query, track_values)
-    
-    connection.commit()
+            ))
+
+    cursor.executemany('''
+    INSERT OR IGNORE INTO Playlists (pid, name, collaborative, modified_at, num_tracks, num_albums, num_followers)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', playlist_rows)
+    cursor.executemany('''
+    INSERT OR IGNORE INTO Tracks (track_uri, playlist_id, pos, track_name, artist_name, artist_uri, album_uri, album_name, duration_ms)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', track_rows)
+
     cursor.close()
-    connection.close()
+    return total_tracks, total_tracks - len(track_rows)
 
-def main():
+def main(inputs='data/*.json', build_sketches=True, build_graph=True):
+    """Import MPD slices from .json, .json.gz or .json.zst files or .zip archives (paths or globs).
+
+    Returns the number of playlists read.
+    """
+    # Published generations are checksummed and must not change; snapshot.py
+    # imports into a new generation file instead
+    require_unpublished(DATABASE)
     create_tables()
 
-    combined_data = []
-    playlistCount = 0
-    #Loads data from json files
-    for filename in glob.glob('data/*.json'):
-        print(playlistCount)
-        playlistCount+=1
-        with open(filename, 'r') as f:
-            data = json.load(f)
-            combined_data.extend(data['playlists'])  # Merge playlists
-
-    # Insert combined data into the database
+    builder = SketchBuilder() if build_sketches else None
+    seen_tracks = None
     connection = create_connection()
     if connection:
-        insert_data(connection, combined_data)
+        # Track URIs already stored, so repeats can be skipped before reaching SQLite
+        seen_tracks = SeenKeys.from_database(connection, 'SELECT track_uri FROM Tracks')
+        connection.close()
+    playlist_count = 0
+    # Each slice is inserted as soon as it is decoded; the next one is read meanwhile
+    for name, playlists in iter_slices(inputs):
+        playlist_count += len(playlists)
+
+        connection = create_connection()
+        if connection:
+            watermark = tracks_watermark(connection)
+            new_playlists = unstored_playlists(connection, playlists)
+            total_tracks, skipped = insert_data(connection, playlists, seen_tracks)
+            # Monthly trending counts for every track occurrence in the slice's new
+            # playlists, committed with them: a rerun skips stored playlists, so
+            # counts committed on their own would be lost for good after a crash
+            update_monthly_counts(connection, new_playlists)
+            connection.commit()
+            print(f"{name}: {len(playlists)} playlists ({playlist_count} total), "
+                  f"{skipped / max(total_tracks, 1):.1%} of {total_tracks} track rows skipped as duplicates")
+
+            # Per-playlist aggregates read by the analytics queries, and per-artist top
+            # tracks ranked by the counts. Both are recomputed for the whole slice, so
+            # a rerun after a crash before this point brings them up to date
+            refresh_features(connection, [playlist["pid"] for playlist in playlists])
+            refresh_top_tracks(connection, {track["artist_name"] for playlist in playlists
+                                            for track in playlist["tracks"]})
+            # Sketches for the tracks this slice added
+            if builder:
+                builder.add_playlists(stored_playlists(connection, watermark))
+            connection.close()
+
+    # Summaries for the approximate analytics mode
+    if builder:
+        connection = create_connection()
+        if connection:
+            builder.save(connection)
+            connection.close()
+
+    # Artist co-occurrence graph used by find_top_artists_with_collaborations
+    if build_graph:
+        connection = create_connection()
+        if connection:
+            build_from_database(connection).save(graph_directory(DATABASE))
+            connection.close()
+    return playlist_count
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Import Million Playlist Dataset slices into SQLite.")
+    parser.add_argument("inputs", nargs="*", default=["data/*.json"],
+                        help="Slice files, globs or archives: *.json, *.json.gz, *.json.zst or the MPD .zip")
+    parser.add_argument("--no-sketches", action="store_true", help="Skip the approximate-query sketches")
+    parser.add_argument("--no-graph", action="store_true", help="Skip the artist co-occurrence graph")
+    args = parser.parse_args()
+    main(args.inputs, build_sketches=not args.no_sketches, build_graph=not args.no_graph)
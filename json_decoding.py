@@ -0,0 +1,87 @@
+import json
+import os
+from typing import List, TypedDict
+
+# Decoder used for slice files: "msgspec", "orjson", "json", or unset for the fastest installed
+JSON_DECODER = os.environ.get('JSON_DECODER')
+
+
+# The playlist and track fields the importer, sketches and embeddings read. The
+# msgspec decoder builds dicts with only these keys and skips everything else.
+class Track(TypedDict):
+    track_uri: str
+    pos: int
+    track_name: str
+    artist_name: str
+    artist_uri: str
+    album_uri: str
+    album_name: str
+    duration_ms: int
+
+
+class Playlist(TypedDict):
+    pid: int
+    name: str
+    collaborative: str
+    modified_at: int
+    num_tracks: int
+    num_albums: int
+    num_followers: int
+    tracks: List[Track]
+
+
+class Slice(TypedDict):
+    playlists: List[Playlist]
+
+
+def _msgspec_decoder():
+    import msgspec
+
+    decoder = msgspec.json.Decoder(Slice)
+    return lambda data: decoder.decode(data)['playlists']
+
+
+def _orjson_decoder():
+    import orjson
+
+    return lambda data: orjson.loads(data)['playlists']
+
+
+def _stdlib_decoder():
+    return lambda data: json.loads(data)['playlists']
+
+
+DECODERS = {
+    'msgspec': _msgspec_decoder,
+    'orjson': _orjson_decoder,
+    'json': _stdlib_decoder,
+}
+
+
+def available_decoders():
+    """Names of the decoders whose library is installed, fastest first."""
+    names = []
+    for name, factory in DECODERS.items():
+        try:
+            factory()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_decoder(name=None):
+    """Return a function decoding a slice file's bytes into its list of playlists.
+
+    Without a name (or JSON_DECODER) the fastest installed backend is used.
+    """
+    name = name or JSON_DECODER
+    if name:
+        return DECODERS[name]()
+    return DECODERS[available_decoders()[0]]()
+
+
+def load_slice(path, decoder=None):
+    """Read one slice file and return its playlists."""
+    with open(path, 'rb') as f:
+        return (decoder or get_decoder())(f.read())
@@ -0,0 +1,304 @@
+import argparse
+import json
+import random
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+
+import credentials
+import database_queries
+import recommendations
+from benchmark import use_database
+from generations import resolve_database
+from write_queue import get_write_queue
+
+# Share of page views per page, roughly what a session on the app does
+PAGE_MIX = {
+    'profile': 0.4,
+    'search': 0.25,
+    'recommendations': 0.2,
+    'database_queries': 0.15,
+}
+
+# Artists users can pick as favorites or search for, by popularity rank
+CANDIDATE_ARTISTS = 5000
+
+# A step in sessions counts as saturated when throughput grows by less than this
+SATURATION_GAIN = 1.1
+
+LOAD_PASSWORD = 'load test password'
+
+
+def classify_error(error):
+    """'lock' for SQLite busy/locked errors, 'busy' when logins are shed, else 'error'."""
+    if isinstance(error, sqlite3.OperationalError) and any(word in str(error).lower() for word in ('locked', 'busy')):
+        return 'lock'
+    if isinstance(error, credentials.CredentialsBusy):
+        return 'busy'
+    return 'error'
+
+
+def load_artists(database):
+    """Artists ranked by track count, most popular first."""
+    connection = sqlite3.connect(f"file:{resolve_database(database)}?mode=ro", uri=True)
+    try:
+        return [row[0] for row in connection.execute(
+            'SELECT artist_name FROM Tracks GROUP BY artist_name ORDER BY COUNT(*) DESC LIMIT ?',
+            (CANDIDATE_ARTISTS,))]
+    finally:
+        connection.close()
+
+
+class ZipfPicker:
+    """Draws items with probability proportional to 1 / rank ** exponent, so a few
+    popular artists are picked by most users and the long tail by a few."""
+
+    def __init__(self, items, exponent):
+        self.items = items
+        weights = 1.0 / np.arange(1, len(items) + 1) ** exponent
+        self.cumulative = np.cumsum(weights / weights.sum())
+
+    def pick(self, rng):
+        index = int(np.searchsorted(self.cumulative, rng.random()))
+        return self.items[min(index, len(self.items) - 1)]
+
+    def pick_set(self, rng, size):
+        picked = []
+        for _ in range(size * 20):
+            if len(picked) == size:
+                break
+            item = self.pick(rng)
+            if item not in picked:
+                picked.append(item)
+        return picked
+
+
+def create_load_users(database, count, picker, rng, mean_favorites):
+    """Create count users with favorite sets drawn from picker, removing any from a previous run."""
+    recommendations.create_users_table()
+    password_hash = credentials.hash_password(LOAD_PASSWORD)
+    users = {}
+    for i in range(count):
+        size = 1 + int(rng.expovariate(1 / max(mean_favorites - 1, 0.1)))
+        users[f'load user {i}'] = picker.pick_set(rng, size)
+
+    connection = sqlite3.connect(database, timeout=30)
+    remove_load_users(connection)
+    connection.executemany('INSERT INTO Users (username, password) VALUES (?, ?)',
+                           [(username, password_hash) for username in users])
+    connection.executemany('INSERT OR IGNORE INTO FavoriteArtists (username, artist_name) VALUES (?, ?)',
+                           [(username, artist) for username, artists in users.items() for artist in artists])
+    connection.commit()
+    connection.close()
+    return users
+
+
+def remove_load_users(connection):
+    for table in ('Users', 'FavoriteArtists', 'Recommendations'):
+        connection.execute(f"DELETE FROM {table} WHERE username LIKE 'load user %'")
+    connection.commit()
+
+
+class LoadStats:
+    """Latencies and failures per operation, shared by the session threads of one step."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.failures = defaultdict(lambda: defaultdict(int))
+        self.pages = 0
+        self.lock = threading.Lock()
+
+    def call(self, name, function, *args):
+        start = time.perf_counter()
+        try:
+            result = function(*args)
+        except Exception as e:
+            with self.lock:
+                self.failures[name][classify_error(e)] += 1
+            return None
+        seconds = time.perf_counter() - start
+        with self.lock:
+            self.latencies[name].append(seconds)
+        return result
+
+    def fail(self, name, kind):
+        with self.lock:
+            self.failures[name][kind] += 1
+
+    def page_viewed(self):
+        with self.lock:
+            self.pages += 1
+
+
+def view_page(stats, page, username, picker, rng):
+    """Make the calls the app makes for one view of page."""
+    if page == 'profile':
+        favorites = stats.call('get_favorite_artists', recommendations.get_favorite_artists, username)
+        if favorites:
+            stats.call('get_duration_histogram', recommendations.get_duration_histogram, favorites)
+            suggested = stats.call('suggest_new_artists', recommendations.suggest_new_artists, favorites)
+            if suggested is not None:
+                stats.call('log_recommendations', recommendations.log_recommendations,
+                           username, suggested['Artist'].tolist())
+            stats.call('get_recommended_tracks', recommendations.get_recommended_tracks, favorites)
+    elif page == 'search':
+        stats.call('search_albums_and_tracks_by_artist', recommendations.search_albums_and_tracks_by_artist,
+                   picker.pick(rng))
+    elif page == 'recommendations':
+        artist = picker.pick(rng)
+        stats.call('get_top_tracks_by_artist', recommendations.get_top_tracks_by_artist, artist)
+        stats.call('get_artists_played_with', recommendations.get_artists_played_with, artist)
+    else:
+        function = rng.choice(database_queries.QUERY_FUNCTIONS)
+        stats.call(function.__name__, function)
+    stats.page_viewed()
+
+
+def run_session(stats, username, picker, think_time, deadline, seed):
+    """Log in, then view pages from PAGE_MIX with exponential think time until deadline."""
+    rng = random.Random(seed)
+    if not stats.call('login_user', recommendations.login_user, username, LOAD_PASSWORD):
+        stats.fail('login_user', 'rejected')
+        return
+    pages, weights = zip(*PAGE_MIX.items())
+    while time.perf_counter() < deadline:
+        view_page(stats, rng.choices(pages, weights)[0], username, picker, rng)
+        if think_time:
+            time.sleep(min(rng.expovariate(1 / think_time), max(deadline - time.perf_counter(), 0)))
+
+
+def run_step(sessions, users, picker, think_time, duration, seed):
+    """Run sessions concurrent sessions for duration seconds; return the step's report."""
+    stats = LoadStats()
+    usernames = list(users)
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=run_session,
+                         args=(stats, usernames[i % len(usernames)], picker, think_time, deadline, seed * 1000 + i))
+        for i in range(sessions)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    operations = {}
+    for name in sorted(set(stats.latencies) | set(stats.failures)):
+        latencies = np.array(stats.latencies.get(name, [])) * 1000
+        operations[name] = {
+            'calls': len(latencies),
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p95_ms': float(np.percentile(latencies, 95)) if len(latencies) else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'failures': dict(stats.failures.get(name, {})),
+        }
+    all_latencies = np.concatenate([np.array(values) for values in stats.latencies.values()]) * 1000 \
+        if stats.latencies else np.array([0.0])
+    calls = sum(len(values) for values in stats.latencies.values())
+    failures = defaultdict(int)
+    for kinds in stats.failures.values():
+        for kind, count in kinds.items():
+            failures[kind] += count
+    return {
+        'sessions': sessions,
+        'seconds': elapsed,
+        'pages': stats.pages,
+        'pages_per_second': stats.pages / elapsed,
+        'calls_per_second': calls / elapsed,
+        'p50_ms': float(np.percentile(all_latencies, 50)),
+        'p95_ms': float(np.percentile(all_latencies, 95)),
+        'p99_ms': float(np.percentile(all_latencies, 99)),
+        'lock_errors': failures.get('lock', 0),
+        'failures': dict(failures),
+        'operations': operations,
+    }
+
+
+def find_saturation(steps):
+    """Sessions at the first step whose throughput grew by less than SATURATION_GAIN, or None."""
+    for previous, step in zip(steps, steps[1:]):
+        if step['pages_per_second'] < previous['pages_per_second'] * SATURATION_GAIN:
+            return step['sessions']
+    return None
+
+
+def print_step(step):
+    print(f"{step['sessions']:>5} sessions: {step['pages_per_second']:7.1f} pages/s "
+          f"{step['calls_per_second']:7.1f} calls/s  p50 {step['p50_ms']:7.1f} ms  p95 {step['p95_ms']:7.1f} ms  "
+          f"p99 {step['p99_ms']:7.1f} ms  lock errors {step['lock_errors']}  failures {step['failures']}")
+
+
+def print_operations(step):
+    print(f"Per operation at {step['sessions']} sessions:")
+    for name, operation in step['operations'].items():
+        if operation['calls']:
+            print(f"  {name}: {operation['calls']} calls, p50 {operation['p50_ms']:.1f} ms, "
+                  f"p95 {operation['p95_ms']:.1f} ms, p99 {operation['p99_ms']:.1f} ms {operation['failures'] or ''}")
+        else:
+            print(f"  {name}: no successful calls {operation['failures']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the app's query paths with many concurrent simulated sessions.")
+    parser.add_argument("--database", default=database_queries.DATABASE)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32],
+                        help="Concurrent sessions at each step")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per step")
+    parser.add_argument("--think-time", type=float, default=1.0,
+                        help="Mean seconds between page views of a session; 0 to send requests back to back")
+    parser.add_argument("--users", type=int, default=200, help="Simulated users; sessions share them round-robin")
+    parser.add_argument("--favorites", type=float, default=5, help="Mean favorite artists per user")
+    parser.add_argument("--zipf", type=float, default=1.1,
+                        help="Exponent of the artist popularity distribution for favorites and searches")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    use_database(args.database)
+    rng = random.Random(args.seed)
+    picker = ZipfPicker(load_artists(args.database), args.zipf)
+    users = create_load_users(args.database, args.users, picker, rng, args.favorites)
+
+    steps = []
+    try:
+        for sessions in args.sessions:
+            step = run_step(sessions, users, picker, args.think_time, args.duration, args.seed)
+            steps.append(step)
+            print_step(step)
+    finally:
+        # Logged recommendations are written in the background; wait for them before cleaning up
+        get_write_queue(args.database).flush()
+        connection = sqlite3.connect(args.database, timeout=30)
+        remove_load_users(connection)
+        connection.close()
+
+    if steps:
+        print_operations(steps[-1])
+    saturation = find_saturation(steps)
+    if saturation:
+        print(f"Throughput stopped scaling at {saturation} sessions")
+    else:
+        print("Throughput kept scaling up to the largest step")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                "created_at": datetime.now().isoformat(),
+                "database": args.database,
+                "think_time": args.think_time,
+                "zipf": args.zipf,
+                "seed": args.seed,
+                "saturated_at": saturation,
+                "steps": steps,
+            }, f, indent=2)
+        print(f"Wrote the report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import os
+import sqlite3
+
+from generations import require_unpublished
+
+# Upper bounds of the follower buckets: bucket 0 is up to 10 followers, bucket 1
+# up to 100, ... bucket 5 is over 10,000. The queries filter on "more than 500"
+# (bucket >= 3) and "more than 1000" (bucket >= 4) followers.
+FOLLOWER_BUCKET_BOUNDS = (10, 100, 500, 1000, 10000)
+
+
+def follower_bucket_sql(column):
+    """SQL expression mapping a follower count column to its bucket."""
+    cases = ' '.join(f'WHEN {column} <= {bound} THEN {bucket}'
+                     for bucket, bound in enumerate(FOLLOWER_BUCKET_BOUNDS))
+    return f'CASE {cases} ELSE {len(FOLLOWER_BUCKET_BOUNDS)} END'
+
+
+def create_features_table(connection):
+    cursor = connection.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS PlaylistFeatures (
+        pid INTEGER PRIMARY KEY,
+        track_count INTEGER,
+        artist_count INTEGER,
+        album_count INTEGER,
+        total_duration_ms INTEGER,
+        avg_duration_ms REAL,
+        follower_bucket INTEGER,
+        FOREIGN KEY (pid) REFERENCES Playlists(pid)
+    )
+    ''')
+    # No query orders or filters on artist_count any more; drop the index older databases have
+    cursor.execute('DROP INDEX IF EXISTS idx_playlist_features_artist_count')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_playlist_features_follower_bucket ON PlaylistFeatures(follower_bucket)')
+    connection.commit()
+    cursor.close()
+
+
+def refresh_features(connection, pids=None):
+    """Recompute the features of the given playlists (all of them if pids is None).
+
+    Features are aggregated from the stored Tracks rows, so they agree with the
+    queries that used to compute them on the fly. Tracks are only ever inserted,
+    never replaced, so refreshing the playlists of each ingested batch is enough
+    to keep the table current.
+    """
+    create_features_table(connection)
+    query = f'''
+        INSERT OR REPLACE INTO PlaylistFeatures
+            (pid, track_count, artist_count, album_count, total_duration_ms, avg_duration_ms, follower_bucket)
+        SELECT p.pid,
+               COUNT(t.track_uri),
+               COUNT(DISTINCT t.artist_name),
+               COUNT(DISTINCT t.album_name),
+               SUM(t.duration_ms),
+               AVG(t.duration_ms),
+               {follower_bucket_sql('p.num_followers')}
+        FROM Playlists p
+        JOIN Tracks t ON t.playlist_id = p.pid
+        {{where}}
+        GROUP BY p.pid
+    '''
+    cursor = connection.cursor()
+    if pids is None:
+        cursor.execute(query.format(where=''))
+    else:
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS refresh_pids (pid INTEGER PRIMARY KEY)')
+        cursor.execute('DELETE FROM refresh_pids')
+        cursor.executemany('INSERT OR IGNORE INTO refresh_pids (pid) VALUES (?)', ((pid,) for pid in pids))
+        cursor.execute(query.format(where='WHERE p.pid IN (SELECT pid FROM refresh_pids)'))
+    connection.commit()
+    cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill the PlaylistFeatures table from Tracks.")
+    parser.add_argument("--database", default=os.environ.get('RECOMMENDATION_DB', 'recommendation.db'))
+    args = parser.parse_args()
+
+    require_unpublished(args.database)
+    connection = sqlite3.connect(args.database)
+    refresh_features(connection)
+    count = connection.execute('SELECT COUNT(*) FROM PlaylistFeatures').fetchone()[0]
+    connection.close()
+    print(f"Computed features for {count} playlists in {args.database}")
+
+
+if __name__ == "__main__":
+    main()
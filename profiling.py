@@ -0,0 +1,297 @@
+import functools
+import inspect
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+
+import query_registry
+
+# Set APP_PROFILING=1 to record a span tree for every rerun of app.py, shown on the Profiling page
+ENABLED = os.environ.get('APP_PROFILING') == '1'
+
+# With APP_PROFILING_SAMPLES set to a file, the rerunning threads are also sampled and the
+# stacks written there in collapsed format (one "frame;frame;frame count" line per stack),
+# which flamegraph.pl and speedscope read
+SAMPLE_OUTPUT = os.environ.get('APP_PROFILING_SAMPLES')
+SAMPLE_INTERVAL = 0.005
+
+# Finished reruns kept for the Profiling page
+KEEP_RERUNS = 100
+
+# Functions from these modules imported into app.py get a span per call
+PROFILED_MODULES = ('database_queries', 'approximate_queries', 'trending_queries', 'recommendations',
+                    'recommendation_server')
+
+
+class Span:
+    """One timed section of a rerun: the rerun itself, a page, a function, a query or a render.
+
+    Memory figures come from tracemalloc, which counts the whole process, so
+    sessions rerunning at the same time show up in each other's spans. Peaks
+    are also unreliable then: every span start calls tracemalloc.reset_peak(),
+    which is process-wide, so a concurrent rerun can wipe a peak this span
+    has not read yet. Trust Peak only for reruns that ran alone.
+    """
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.children = []
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.start_memory = tracemalloc.get_traced_memory()[0]
+        self.peak_memory = self.start_memory
+        # Net bytes still allocated when the span ended, and the high-water mark above its start
+        self.allocated = 0
+        self.peak = 0
+        self.samples = 0
+
+    def finish(self):
+        current, peak = tracemalloc.get_traced_memory()
+        self.seconds = time.perf_counter() - self.start
+        self.peak_memory = max(self.peak_memory, peak)
+        self.allocated = current - self.start_memory
+        self.peak = self.peak_memory - self.start_memory
+
+    def self_seconds(self):
+        return self.seconds - sum(child.seconds for child in self.children)
+
+    def walk(self, depth=0):
+        """(depth, span) for this span and every span under it, depth first."""
+        yield depth, self
+        for child in self.children:
+            yield from child.walk(depth + 1)
+
+
+class _NoSpan:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_no_span = _NoSpan()
+_local = threading.local()
+
+_reruns = deque(maxlen=KEEP_RERUNS)
+_reruns_lock = threading.Lock()
+
+# thread id -> root span of the rerun running on it, read by the sampler
+_active = {}
+_stacks = Counter()
+_stacks_lock = threading.Lock()
+_sampler = None
+
+
+def _open_spans():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _push(kind, name):
+    stack = _open_spans()
+    if stack:
+        # The parent's peak so far must be kept before the peak is reset for the child
+        parent = stack[-1]
+        parent.peak_memory = max(parent.peak_memory, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    span = Span(kind, name)
+    if stack:
+        stack[-1].children.append(span)
+    stack.append(span)
+    return span
+
+
+def _pop():
+    stack = _open_spans()
+    span = stack.pop()
+    span.finish()
+    if stack:
+        stack[-1].peak_memory = max(stack[-1].peak_memory, span.peak_memory)
+    return span
+
+
+class _SpanContext:
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+
+    def __enter__(self):
+        if not _open_spans():
+            return None
+        return _push(self.kind, self.name)
+
+    def __exit__(self, *exc):
+        if _open_spans():
+            _pop()
+        return False
+
+
+def span(kind, name):
+    """Context manager timing a section of the current rerun; does nothing when profiling is off."""
+    if not ENABLED:
+        return _no_span
+    return _SpanContext(kind, name)
+
+
+def start_rerun(name='rerun'):
+    """Open the root span of a rerun on this thread.
+
+    app.py finishes each rerun in a finally; a rerun still open on this thread
+    (a script that skipped it) is finished here first.
+    """
+    if not ENABLED:
+        return
+    if _open_spans():
+        finish_rerun()
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if SAMPLE_OUTPUT:
+        _start_sampler()
+    tracemalloc.reset_peak()
+    root = _push('rerun', name)
+    _active[threading.get_ident()] = root
+
+
+def enter_page(name):
+    """Open a page span that stays open until the end of the rerun."""
+    if ENABLED and _open_spans():
+        _push('page', name)
+
+
+def finish_rerun():
+    """Close every span still open on this thread and keep the rerun."""
+    if not ENABLED:
+        return
+    stack = _open_spans()
+    if not stack:
+        return
+    while len(stack) > 1:
+        _pop()
+    _active.pop(threading.get_ident(), None)
+    root = _pop()
+    with _reruns_lock:
+        _reruns.append(root)
+    if SAMPLE_OUTPUT:
+        write_samples(SAMPLE_OUTPUT)
+
+
+def _record_query(name, seconds):
+    """query_registry timing hook: add the finished query under the open span."""
+    stack = _open_spans()
+    if not stack:
+        return
+    query = Span('query', name)
+    query.seconds = seconds
+    stack[-1].children.append(query)
+
+
+def profiled(function, kind='function'):
+    """Wrap function so every call made during a rerun gets a span."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _open_spans():
+            return function(*args, **kwargs)
+        with _SpanContext(kind, function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def instrument(namespace):
+    """Profiled versions of the functions in namespace that come from PROFILED_MODULES."""
+    if not ENABLED:
+        return {}
+    return {
+        name: profiled(value) for name, value in namespace.items()
+        if inspect.isfunction(value) and value.__module__ in PROFILED_MODULES
+    }
+
+
+def slowest_reruns(limit=20):
+    with _reruns_lock:
+        reruns = list(_reruns)
+    return sorted(reruns, key=lambda root: root.seconds, reverse=True)[:limit]
+
+
+def rerun_summary(root):
+    pages = [child.name for child in root.children if child.kind == 'page']
+    return {
+        'Started': time.strftime('%H:%M:%S', time.localtime(root.started)),
+        'Page': pages[0] if pages else root.name,
+        'Total (ms)': round(root.seconds * 1000, 1),
+        'Queries (ms)': round(sum(span.seconds for depth, span in root.walk() if span.kind == 'query') * 1000, 1),
+        'Allocated (KiB)': round(root.allocated / 1024, 1),
+        'Peak (KiB)': round(root.peak / 1024, 1),
+        'Samples': root.samples,
+    }
+
+
+def breakdown(root):
+    """One row per span of a rerun, indented by depth."""
+    return [
+        {
+            'Span': '    ' * depth + span.name,
+            'Kind': span.kind,
+            'Total (ms)': round(span.seconds * 1000, 2),
+            'Self (ms)': round(span.self_seconds() * 1000, 2),
+            'Allocated (KiB)': round(span.allocated / 1024, 1) if span.kind != 'query' else None,
+            'Peak (KiB)': round(span.peak / 1024, 1) if span.kind != 'query' else None,
+        }
+        for depth, span in root.walk()
+    ]
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _sample_loop():
+    while True:
+        time.sleep(SAMPLE_INTERVAL)
+        frames = sys._current_frames()
+        for thread_id, root in list(_active.items()):
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            with _stacks_lock:
+                _stacks[';'.join(reversed(names))] += 1
+            root.samples += 1
+
+
+def _start_sampler():
+    global _sampler
+    if _sampler is None:
+        _sampler = threading.Thread(target=_sample_loop, name='profiling-sampler', daemon=True)
+        _sampler.start()
+
+
+def collapsed_stacks():
+    """Every stack sampled so far, in collapsed format."""
+    with _stacks_lock:
+        stacks = _stacks.most_common()
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks)
+
+
+def write_samples(path):
+    # Sessions finishing reruns at the same time each write their own temporary file
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + '.')
+    with os.fdopen(fd, 'w') as f:
+        f.write(collapsed_stacks())
+    os.replace(temporary, path)
+
+
+if ENABLED:
+    query_registry.add_timing_hook(_record_query)
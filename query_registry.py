@@ -0,0 +1,226 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from generations import resolve_database
+
+DATABASE = os.environ.get('RECOMMENDATION_DB', 'recommendation.db')
+POOL_SIZE = 8
+
+# Every read query the app runs, by name. Each text is fixed: variable-length
+# artist lists are loaded into the favorite_set temp table (see load_favorite_set)
+# and joined against, so sqlite3's per-connection statement cache prepares each
+# query once and the text never depends on how many favorites a user has.
+# CROSS JOIN pins the join order in SQLite: the temp table has no statistics, and
+# without it the planner may scan all of Tracks instead of starting from the favorites.
+QUERIES = {
+    'get_password_hash': '''
+        SELECT password FROM Users WHERE username = ?
+    ''',
+    'get_favorite_artists': '''
+        SELECT artist_name FROM FavoriteArtists WHERE username = ?
+    ''',
+    'get_recent_recommendations': '''
+        SELECT recommendation FROM Recommendations WHERE username = ? ORDER BY date DESC LIMIT 5
+    ''',
+    'artist_track_counts': '''
+        SELECT artist_name, COUNT(*) as track_count
+        FROM Tracks
+        GROUP BY artist_name
+    ''',
+    'get_tracks_for_favorite_artists': '''
+        SELECT t.artist_name, t.track_name, t.duration_ms, t.playlist_id
+        FROM favorite_set f
+        CROSS JOIN Tracks t ON t.artist_name = f.artist_name
+    ''',
+    'favorite_duration_histogram': '''
+        SELECT t.artist_name, t.duration_ms / ?1 AS bin, COUNT(*) AS track_count
+        FROM favorite_set f
+        CROSS JOIN Tracks t ON t.artist_name = f.artist_name
+        WHERE t.duration_ms IS NOT NULL
+        GROUP BY t.artist_name, bin
+    ''',
+    'suggest_new_artists': '''
+        SELECT t2.artist_name, COUNT(*) as artist_count
+        FROM favorite_set f
+        CROSS JOIN Tracks t1 ON t1.artist_name = f.artist_name
+        CROSS JOIN Tracks t2 ON t2.playlist_id = t1.playlist_id
+        WHERE t2.artist_name NOT IN (SELECT artist_name FROM favorite_set)
+        GROUP BY t2.artist_name
+        ORDER BY artist_count DESC
+        LIMIT 10
+    ''',
+    # Cut off at ?1 tracks: the app shows 10, evaluation.py scores the top k
+    'get_recommended_tracks': '''
+        SELECT t2.track_name, t2.artist_name, COUNT(*) AS appearance_count
+        FROM favorite_set f
+        CROSS JOIN Tracks t1 ON t1.artist_name = f.artist_name
+        CROSS JOIN Tracks t2 ON t2.playlist_id = t1.playlist_id
+        WHERE t2.artist_name NOT IN (SELECT artist_name FROM favorite_set)
+        GROUP BY t2.track_name, t2.artist_name
+        ORDER BY appearance_count DESC
+        LIMIT ?1
+    ''',
+    'search_albums_and_tracks_by_artist': '''
+        SELECT t.album_name, t.track_name
+        FROM Tracks t
+        WHERE t.artist_name LIKE ?
+        ORDER BY t.album_name, t.track_name
+    ''',
+    'get_top_tracks_by_artist': '''
+        SELECT track_name, track_count
+        FROM ArtistTopTracks
+        WHERE artist_name = ?
+        ORDER BY track_rank
+        LIMIT 5
+    ''',
+    'get_artists_played_with': '''
+        SELECT DISTINCT t2.artist_name, COUNT(*) as artist_count
+        FROM Tracks t1
+        JOIN Tracks t2 ON t1.playlist_id = t2.playlist_id
+        WHERE t1.artist_name = ? AND t2.artist_name != ?
+        GROUP BY t2.artist_name
+        ORDER BY artist_count DESC
+        LIMIT 5
+    ''',
+}
+
+# Queries on the user tables, which stay in DATABASE; the rest read the
+# catalog generation it currently points to (see generations.py)
+USER_QUERIES = {'get_password_hash', 'get_favorite_artists', 'get_recent_recommendations'}
+
+
+FAVORITE_SET_TABLE = '''
+    CREATE TEMP TABLE IF NOT EXISTS favorite_set (
+        artist_name TEXT PRIMARY KEY
+    )
+'''
+
+
+class ConnectionPool:
+    """A fixed number of long-lived connections, each keeping its prepared statements."""
+
+    def __init__(self, database, size=POOL_SIZE):
+        self.database = database
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.created < self.size:
+                self.created += 1
+                return sqlite3.connect(self.database, check_same_thread=False,
+                                       cached_statements=len(QUERIES) * 2)
+        return self.idle.get()
+
+    def release(self, connection):
+        if self.closed:
+            connection.close()
+        else:
+            self.idle.put(connection)
+
+    def close(self):
+        """Close idle connections now and the ones in use when they are released."""
+        self.closed = True
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# name -> [calls, total seconds, slowest call in seconds]
+stats = {}
+_stats_lock = threading.Lock()
+timing_hooks = []
+
+
+def get_pool(database=None):
+    """Pool for database (the catalog generation DATABASE points to by default).
+
+    When a new generation is published the pool of the old one is closed, so
+    connections reopen on the new file without restarting the process.
+    """
+    database = database or resolve_database(DATABASE)
+    with _pools_lock:
+        pool = _pools.get(database)
+        if pool is None:
+            if database != DATABASE:
+                for path in [path for path in _pools if path not in (DATABASE, database)]:
+                    _pools.pop(path).close()
+            pool = _pools[database] = ConnectionPool(database)
+        return pool
+
+
+def add_timing_hook(hook):
+    """Call hook(name, seconds) after every registry query."""
+    timing_hooks.append(hook)
+
+
+def _record(name, seconds):
+    with _stats_lock:
+        entry = stats.setdefault(name, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+    for hook in timing_hooks:
+        hook(name, seconds)
+
+
+def run(name, params=(), fetch_one=False, artists=None):
+    """Execute the registered query name on a pooled connection and return its rows.
+
+    If artists is given it is loaded into the connection's favorite_set temp
+    table first, for the queries that join against it.
+    """
+    pool = get_pool(DATABASE if name in USER_QUERIES else None)
+    connection = pool.acquire()
+    start = time.perf_counter()
+    try:
+        if artists is not None:
+            load_favorite_set(connection, artists)
+        cursor = connection.execute(QUERIES[name], params)
+        try:
+            return cursor.fetchone() if fetch_one else cursor.fetchall()
+        finally:
+            cursor.close()
+    finally:
+        _record(name, time.perf_counter() - start)
+        pool.release(connection)
+
+
+def load_favorite_set(connection, artists):
+    """Replace the connection's favorite_set temp table with artists.
+
+    The temp table lives in the connection's private temp database, so loading
+    it never takes a lock on the shared database file.
+    """
+    connection.execute(FAVORITE_SET_TABLE)
+    connection.execute('DELETE FROM favorite_set')
+    # One statement for the whole set, in key order so each row is appended to the
+    # primary key B-tree; a row per executemany step dominated at 10,000 artists
+    connection.execute('INSERT INTO favorite_set (artist_name) SELECT value FROM json_each(?)',
+                       (json.dumps(sorted(set(artists))),))
+    connection.commit()
+
+
+def query_stats():
+    """Per-query call count, mean and max latency in milliseconds."""
+    with _stats_lock:
+        return {
+            name: {'calls': calls, 'mean_ms': total / calls * 1000, 'max_ms': slowest * 1000}
+            for name, (calls, total, slowest) in stats.items()
+        }
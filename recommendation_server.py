@@ -0,0 +1,189 @@
+import argparse
+import json
+import multiprocessing
+import os
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 8765
+
+# Read-only functions the server runs, by module. Writes, logins and the
+# session cache stay in the Streamlit process.
+SERVED_FUNCTIONS = {
+    'database_queries': [
+        'get_top_albums_by_track_count',
+        'calculate_average_track_duration_per_album',
+        'identify_playlists_with_most_artists',
+        'get_top_artists_by_track_count',
+        'calculate_average_tracks_per_playlist',
+        'get_albums_with_more_than_five_tracks',
+        'find_playlists_with_multiple_artists',
+        'get_artist_popularity_by_track_occurrences',
+        'find_playlists_with_high_avg_track_duration_artists',
+        'get_total_tracks_in_collaborative_playlists',
+        'calculate_average_track_duration',
+        'find_top_artists_with_collaborations',
+        'get_most_popular_tracks_by_artist',
+        'find_playlists_with_diverse_artists_and_albums',
+        'calculate_artist_popularity_index',
+    ],
+    'approximate_queries': [
+        'identify_playlists_with_most_artists_approx',
+        'find_top_artists_with_collaborations_approx',
+        'find_playlists_with_diverse_artists_and_albums_approx',
+        'get_most_popular_tracks_by_artist_approx',
+        'get_top_artists_by_track_count_approx',
+        'describe_error_bound',
+    ],
+    'trending_queries': [
+        'get_months',
+        'get_top_artists_in_window',
+        'get_top_tracks_in_window',
+        'get_fastest_rising_artists',
+    ],
+    'recommendations': [
+        'get_tracks_for_favorite_artists',
+        'get_duration_histogram',
+        'suggest_new_artists',
+        'get_recommended_tracks',
+        'get_similar_tracks',
+        'search_albums_and_tracks_by_artist',
+        'get_top_tracks_by_artist',
+        'get_artists_played_with',
+    ],
+}
+
+
+def _encode(value):
+    """JSON-safe form of a result: figures and dataframes are tagged so the client can rebuild them."""
+    if hasattr(value, 'to_plotly_json'):
+        return {'__figure__': value.to_json()}
+    if hasattr(value, 'to_dict') and hasattr(value, 'columns'):
+        return {'__dataframe__': value.to_dict(orient='split')}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict) and '__figure__' in value:
+        import plotly.io as pio
+        return pio.from_json(value['__figure__'])
+    if isinstance(value, dict) and '__dataframe__' in value:
+        import pandas as pd
+        split = value['__dataframe__']
+        return pd.DataFrame(split['data'], index=split['index'], columns=split['columns'])
+    if isinstance(value, list):
+        # Rows come back from SQLite as tuples; keep that shape for the callers
+        return [tuple(row) if isinstance(row, list) else row for row in value]
+    return value
+
+
+_functions = {}
+
+
+def _initialize_worker():
+    """Import the served functions and open the memory-mapped indexes once per worker.
+
+    The graph and embedding arrays are memory-mapped read-only, so every worker
+    shares the same pages of the operating system's file cache.
+    """
+    import importlib
+
+    from artist_graph import load_graph
+    from database_queries import DATABASE
+    from embeddings import load_embeddings
+
+    for module_name, names in SERVED_FUNCTIONS.items():
+        module = importlib.import_module(module_name)
+        for name in names:
+            _functions[name] = getattr(module, name)
+    load_graph(DATABASE)
+    load_embeddings()
+
+
+def _call(name, args):
+    # Serialize in the worker too, so the server threads only pass bytes along
+    return json.dumps({'result': _encode(_functions[name](*args))}, default=str).encode()
+
+
+class RecommendationServer(ThreadingHTTPServer):
+    """Localhost HTTP front end: each request thread hands its call to the worker pool."""
+
+    daemon_threads = True
+
+    def __init__(self, address, workers):
+        super().__init__(address, RequestHandler)
+        self.allowed = {name for names in SERVED_FUNCTIONS.values() for name in names}
+        # spawn, so workers never inherit open SQLite connections or threads
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_initialize_worker)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        name = self.path.rstrip('/').rsplit('/', 1)[-1]
+        if not self.path.startswith('/call/') or name not in self.server.allowed:
+            self.send_error(404, f"Unknown function: {name}")
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            args = json.loads(self.rfile.read(length) or b'{}').get('args', [])
+            body = self.server.pool.submit(_call, name, args).result()
+        except Exception as e:
+            self.send_error(500, f"{type(e).__name__}: {e}")
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def call_remote(server_url, name, *args):
+    """Call a served function and return its decoded result."""
+    request = urllib.request.Request(
+        f"{server_url.rstrip('/')}/call/{name}",
+        data=json.dumps({'args': list(args)}).encode(),
+        headers={'Content-Type': 'application/json'},
+    )
+    with urllib.request.urlopen(request) as response:
+        return _decode(json.load(response)['result'])
+
+
+def remote_functions(server_url):
+    """Stand-ins for every served function that forward their calls to the server."""
+    def remote(name):
+        def function(*args):
+            return call_remote(server_url, name, *args)
+        function.__name__ = name
+        return function
+
+    return {name: remote(name) for names in SERVED_FUNCTIONS.values() for name in names}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recommendation and analytics queries from worker processes.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    server = RecommendationServer((args.host, args.port), args.workers)
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import math
+import os
+import sqlite3
+
+import streamlit as st
+
+import query_registry
+from credentials import CredentialsBusy, hash_password, login_limiter, verify_password
+from bplus_tree import BPlusTree
+from session_cache import favorites_cache
+from write_queue import get_write_queue
+
+DATABASE = os.environ.get('RECOMMENDATION_DB', 'recommendation.db')
+
+def create_connection():
+    connection = None
+    try:
+        connection = sqlite3.connect(DATABASE)
+        return connection
+    except sqlite3.Error as e:
+        st.error(f"Error: '{e}'")
+        return None
+
+# Function to create necessary tables
+def create_users_table():
+    """Create the user tables; the catalog tables belong to import_json.py and snapshot.py."""
+    connection = create_connection()
+    if connection:
+        cursor = connection.cursor()
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL
+        )
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS FavoriteArtists (
+            username TEXT,
+            artist_name TEXT,
+            FOREIGN KEY (username) REFERENCES Users(username)
+        )
+        ''')
+        # Duplicates could be inserted before the unique index existed; keep the first of each
+        cursor.execute('''
+        DELETE FROM FavoriteArtists
+        WHERE rowid NOT IN (SELECT MIN(rowid) FROM FavoriteArtists GROUP BY username, artist_name)
+        ''')
+        cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_favorite_artists_username_artist
+        ON FavoriteArtists(username, artist_name)
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Recommendations (
+            username TEXT,
+            recommendation TEXT,
+            date DATE DEFAULT (datetime('now','localtime')),
+            FOREIGN KEY (username) REFERENCES Users(username)
+        )
+        ''')
+        connection.commit()
+        cursor.close()
+        connection.close()
+
+
+def register_user(username, password):
+    try:
+        get_write_queue(DATABASE).execute('INSERT INTO Users (username, password) VALUES (?, ?)',
+                                          (username, hash_password(password)))
+    except sqlite3.IntegrityError:
+        st.error("Username already taken")
+
+def login_user(username, password):
+    retry_after = login_limiter.retry_after(username)
+    if retry_after:
+        wait = f"{math.ceil(retry_after)} seconds" if retry_after < 60 else f"{math.ceil(retry_after / 60)} minutes"
+        st.error(f"Too many failed logins. Try again in {wait}.")
+        return False
+    row = query_registry.run('get_password_hash', (username,), fetch_one=True)
+    stored = row[0] if row else None
+    try:
+        matches, new_hash = verify_password(password, stored)
+    except CredentialsBusy:
+        st.error("The server is busy. Please try again.")
+        return False
+    if not matches:
+        login_limiter.record_failure(username)
+        return False
+    login_limiter.reset(username)
+    if new_hash:
+        # Upgrade a legacy SHA-256 (or weaker scrypt) hash now that the password is known
+        get_write_queue(DATABASE).submit('UPDATE Users SET password = ? WHERE username = ? AND password = ?',
+                                         (new_hash, username, stored))
+    return True
+
+
+def get_favorite_artists(username):
+    artists = query_registry.run('get_favorite_artists', (username,))
+    return [artist[0] for artist in artists]
+
+
+def add_favorite_artist(username, artist_name):
+    try:
+        get_write_queue(DATABASE).execute('INSERT INTO FavoriteArtists (username, artist_name) VALUES (?, ?)',
+                                          (username, artist_name))
+    except sqlite3.IntegrityError:
+        st.error("This artist is already in your favorites.")
+        return
+    # Only fetch the new artist's rows into the cached session data
+    if favorites_cache.get(username) is not None:
+        favorites_cache.add_artist(username, artist_name, get_duration_histogram([artist_name]))
+
+def log_recommendations(username, recommendations):
+    """Record recommendations shown to a user without waiting for the commit."""
+    write_queue = get_write_queue(DATABASE)
+    for recommendation in recommendations:
+        write_queue.submit('INSERT INTO Recommendations (username, recommendation) VALUES (?, ?)',
+                           (username, recommendation))
+
+def get_recent_recommendations(username):
+    recs = query_registry.run('get_recent_recommendations', (username,))
+    return [rec[0] for rec in recs]
+
+
+def build_artist_popularity_index():
+    artists_data = query_registry.run('artist_track_counts')
+
+    bptree = BPlusTree(order=4)
+
+    for artist in artists_data:
+        if artist[1] > 0:  
+            bptree.insert(artist[0], artist[1])
+
+    return bptree
+
+def get_tracks_for_favorite_artists(favorite_artists):
+    import pandas as pd
+
+    tracks = query_registry.run('get_tracks_for_favorite_artists', artists=favorite_artists)
+    return pd.DataFrame(tracks, columns=['Artist', 'Track', 'Duration', 'PlaylistID'])
+
+
+# Width of the duration histogram bins; the chart payload is one row per artist and bin
+DURATION_BIN_MS = 15000
+
+
+def get_duration_histogram(favorite_artists):
+    """Track counts per artist and duration bin, with the bin centre in minutes."""
+    import pandas as pd
+
+    bins = query_registry.run('favorite_duration_histogram', (DURATION_BIN_MS,), artists=favorite_artists)
+    return pd.DataFrame(
+        [(artist, (bin + 0.5) * DURATION_BIN_MS / 60000, count) for artist, bin, count in bins],
+        columns=['Artist', 'Duration', 'Tracks'],
+    )
+
+
+def suggest_new_artists(favorite_artists):
+    import pandas as pd
+
+    suggested_artists = query_registry.run('suggest_new_artists', artists=favorite_artists)
+    return pd.DataFrame(suggested_artists, columns=['Artist', 'Artist Count'])
+
+
+def get_recommended_tracks(favorite_artists):
+    """Fetch recommended tracks and return a plot based on favorite artists' co-occurrence in playlists."""
+    import pandas as pd
+    import plotly.express as px
+
+    results = query_registry.run('get_recommended_tracks', (10,), artists=favorite_artists)
+    if results:
+        df = pd.DataFrame(results, columns=['Track Name', 'Artist', 'Appearances'])
+        fig = px.bar(df, x='Track Name', y='Appearances', color='Artist', title="Recommended Tracks Based on Co-occurrences")
+        return fig
+    print("No recommended tracks found.")
+    return None
+
+def get_similar_tracks(favorite_artists):
+    """Return a plot of the tracks closest to the favorite artists in the embedding space, or None."""
+    from embeddings import load_embeddings
+
+    embeddings = load_embeddings()
+    if embeddings is None:
+        return None
+    results = embeddings.recommend_for_artists(favorite_artists)
+    if not results:
+        return None
+
+    import pandas as pd
+    import plotly.express as px
+
+    df = pd.DataFrame(results, columns=['Track Name', 'Artist', 'Similarity'])
+    return px.bar(df, x='Track Name', y='Similarity', color='Artist', title="Tracks Like Your Favorite Artists")
+
+def search_albums_and_tracks_by_artist(artist_name):
+    import pandas as pd
+
+    results = query_registry.run('search_albums_and_tracks_by_artist', ('%' + artist_name + '%',))
+    if results:
+        return pd.DataFrame(results, columns=['Album', 'Track'])
+    st.write("No albums or tracks found for the specified artist.")
+    return pd.DataFrame(columns=['Album', 'Track'])
+
+
+def get_top_tracks_by_artist(artist_name):
+    """Recommend top tracks by the artist themselves."""
+    return query_registry.run('get_top_tracks_by_artist', (artist_name,))
+
+
+def get_artists_played_with(artist_name):
+    """Recommend other artists based on playlists with the input artist."""
+    return query_registry.run('get_artists_played_with', (artist_name, artist_name))
@@ -0,0 +1,127 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+def estimate_size(value):
+    """Estimate the memory footprint of a cached value in bytes."""
+    if hasattr(value, 'memory_usage'):  # pandas DataFrame
+        return int(value.memory_usage(deep=True).sum())
+    if hasattr(value, 'to_plotly_json'):  # plotly Figure; getsizeof only sees the wrapper object
+        return len(value.to_json())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(estimate_size(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+class CacheEntry:
+    def __init__(self, favorite_artists, duration_bins, generation=None):
+        self.artists = list(dict.fromkeys(favorite_artists))
+        # Catalog generation the bins were read from (see generations.py)
+        self.generation = generation
+        # Per-artist track counts by duration bin; additive, so one artist's rows can be appended
+        self.duration_bins = duration_bins
+        # Values that depend on the whole favorite set (suggestions, figures)
+        self.derived = {}
+        self.size = 0
+
+    def artist_set(self):
+        return frozenset(self.artists)
+
+    def compute_size(self):
+        self.size = estimate_size(self.duration_bins) + estimate_size(self.derived)
+        return self.size
+
+
+class FavoriteArtistsCache:
+    """LRU cache of favorite artists and their binned track data, shared by every session.
+
+    Streamlit re-executes app.py on each rerun but keeps imported modules, so an
+    instance living here survives reruns. Entries are keyed by username and hold
+    the favorite-artist set they were built for; the least recently used users
+    are evicted once the total size goes over max_bytes.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, username, favorite_artists=None, generation=None):
+        """Return the entry for username, or None if missing or built for another favorite
+        set or catalog generation."""
+        with self.lock:
+            entry = self.entries.get(username)
+            if entry is None:
+                return None
+            if (favorite_artists is not None and entry.artist_set() != frozenset(favorite_artists)
+                    or generation is not None and entry.generation != generation):
+                self._remove(username)
+                return None
+            self.entries.move_to_end(username)
+            return entry
+
+    def put(self, username, favorite_artists, duration_bins, generation=None):
+        """Store freshly fetched duration bins for a user's favorite artists."""
+        entry = CacheEntry(favorite_artists, duration_bins, generation)
+        with self.lock:
+            self._remove(username)
+            self.entries[username] = entry
+            self.total_bytes += entry.compute_size()
+            self._evict()
+        return entry
+
+    def add_artist(self, username, artist_name, artist_bins):
+        """Append one artist's bins to a cached entry instead of rebuilding it."""
+        import pandas as pd
+
+        with self.lock:
+            entry = self.entries.get(username)
+            if entry is None or artist_name in entry.artists:
+                return entry
+            self.total_bytes -= entry.size
+            entry.artists.append(artist_name)
+            entry.duration_bins = pd.concat([entry.duration_bins, artist_bins], ignore_index=True)
+            entry.derived = {}
+            self.total_bytes += entry.compute_size()
+            self.entries.move_to_end(username)
+            self._evict()
+            return entry
+
+    def set_derived(self, username, name, value, favorite_artists, generation=None):
+        """Attach a value computed from the favorite set favorite_artists to a cached entry.
+
+        Another session may have added an artist or replaced the entry while the
+        value was being built, so it is only stored if the entry still holds
+        that set (and generation).
+        """
+        with self.lock:
+            entry = self.entries.get(username)
+            if (entry is None or entry.artist_set() != frozenset(favorite_artists)
+                    or generation is not None and entry.generation != generation):
+                return
+            self.total_bytes -= entry.size
+            entry.derived[name] = value
+            self.total_bytes += entry.compute_size()
+            self._evict()
+
+    def invalidate(self, username):
+        with self.lock:
+            self._remove(username)
+
+    def _remove(self, username):
+        entry = self.entries.pop(username, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+
+    def _evict(self):
+        # Never evict the most recently used entry, even if it alone exceeds the cap
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, entry = self.entries.popitem(last=False)
+            self.total_bytes -= entry.size
+
+
+favorites_cache = FavoriteArtistsCache()
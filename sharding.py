@@ -0,0 +1,455 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from generations import resolve_database
+from sketches import HyperLogLog, hash64
+
+DATABASE = os.environ.get('RECOMMENDATION_DB', 'recommendation.db')
+
+# Shards written by split_database (and by snapshot.py when set); 0 leaves the catalog unsharded
+SHARD_COUNT = int(os.environ.get('RECOMMENDATION_SHARDS', '0'))
+
+# Processes running per-shard partial queries
+SHARD_WORKERS = int(os.environ.get('SHARD_WORKERS', '0')) or os.cpu_count() or 1
+
+# Tables partitioned by playlist, with the column holding the pid; the other
+# catalog tables (ArtistTopTracks, Sketches, ...) are global and stay unsharded
+SHARDED_TABLES = (('Playlists', 'pid'), ('Tracks', 'playlist_id'), ('PlaylistFeatures', 'pid'))
+
+SHARD_PATTERN = re.compile(r'\.shard(\d+)of(\d+)$')
+
+# Distinct counts per playlist name are merged as HyperLogLog sketches of this
+# precision (1 KiB of registers, ~3% standard error). Below SPARSE_LIMIT distinct
+# values a name ships its 64-bit value hashes instead, which are no bigger and
+# keep the count exact; the MPD's playlist names mostly stay under it.
+DISTINCT_PRECISION = 10
+SPARSE_LIMIT = (1 << DISTINCT_PRECISION) // 8
+
+# Standard errors either side of a HyperLogLog estimate that bound the true
+# count when deciding which names could make a top-k list
+ERROR_MARGIN = 4
+
+
+def shard_path(catalog, index, count):
+    base, extension = os.path.splitext(catalog)
+    return f"{base}.shard{index}of{count}{extension}"
+
+
+def shard_paths(catalog):
+    """Shard files of catalog in order, or None unless a complete set exists."""
+    base, extension = os.path.splitext(catalog)
+    found = {}
+    for path in glob.glob(f"{glob.escape(base)}.shard*{extension}"):
+        match = SHARD_PATTERN.search(os.path.splitext(path)[0])
+        if match:
+            found.setdefault(int(match.group(2)), {})[int(match.group(1))] = path
+    # The newest complete set, in case a split with another count was interrupted
+    for count in sorted(found, reverse=True):
+        if len(found[count]) == count:
+            return [found[count][index] for index in range(count)]
+    return None
+
+
+# Worker side: each process keeps one read-only connection per shard file
+_connections = {}
+
+
+def _connect(path):
+    connection = _connections.get(path)
+    if connection is None:
+        connection = _connections[path] = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    return connection
+
+
+def _run_partial(path, query, params):
+    return _connect(path).execute(query, params).fetchall()
+
+
+def _add_hashes(sketch, hashes):
+    """Add value hashes to a sketch: a set of hashes, turned into a HyperLogLog past SPARSE_LIMIT."""
+    if isinstance(sketch, set):
+        sketch.update(hashes)
+        if len(sketch) <= SPARSE_LIMIT:
+            return sketch
+        hashes, sketch = sketch, HyperLogLog(DISTINCT_PRECISION)
+    for h in hashes:
+        sketch.add_hash(h)
+    return sketch
+
+
+def _run_distinct(path, query, params):
+    """Run a (key, value) query and return {key: sketch of its distinct values}."""
+    sketches = {}
+    hashes = {}
+    for key, value in _connect(path).execute(query, params):
+        if value is None:
+            sketches.setdefault(key, set())
+            continue
+        h = hashes.get(value)
+        if h is None:
+            h = hashes[value] = hash64(value)
+        sketches[key] = _add_hashes(sketches.get(key, set()), (h,))
+    return sketches
+
+
+def _build_shard(catalog, index, count):
+    """Copy the playlists with pid % count == index (and their tracks and features) into one shard."""
+    path = shard_path(catalog, index, count)
+    if os.path.exists(path + '.tmp'):
+        os.remove(path + '.tmp')
+    # uri=True, so the read-only ATTACH URI is honoured on builds without SQLITE_USE_URI
+    connection = sqlite3.connect(path + '.tmp', uri=True)
+    connection.execute('ATTACH DATABASE ? AS source', (f"file:{catalog}?mode=ro",))
+    names = [table for table, _ in SHARDED_TABLES]
+    placeholders = ', '.join('?' * len(names))
+    for (sql,) in connection.execute(
+            f"SELECT sql FROM source.sqlite_master WHERE type = 'table' AND name IN ({placeholders})", names).fetchall():
+        connection.execute(sql)
+    counts = {}
+    for table, column in SHARDED_TABLES:
+        cursor = connection.execute(f'INSERT INTO main.{table} SELECT * FROM source.{table} WHERE {column} % ? = ?',
+                                    (count, index))
+        counts[table] = cursor.rowcount
+    # Indexes after the bulk copy, so they are built once instead of row by row
+    for (sql,) in connection.execute(
+            f"SELECT sql FROM source.sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+            f"AND tbl_name IN ({placeholders})", names).fetchall():
+        connection.execute(sql)
+    connection.commit()
+    connection.execute('DETACH DATABASE source')
+    connection.execute('ANALYZE')
+    connection.commit()
+    connection.close()
+    os.replace(path + '.tmp', path)
+    return counts
+
+
+def remove_shards(catalog):
+    base, extension = os.path.splitext(catalog)
+    for path in glob.glob(f"{glob.escape(base)}.shard*{extension}"):
+        if SHARD_PATTERN.search(os.path.splitext(path)[0]):
+            os.remove(path)
+
+
+def split_database(catalog, count):
+    """Partition catalog's playlists by pid hash into count shard files next to it.
+
+    Shards are built in parallel, one writer per file, and checked against the
+    catalog's row counts. Returns the list of problems found (empty if none).
+    """
+    remove_shards(catalog)
+    with ProcessPoolExecutor(max_workers=min(count, SHARD_WORKERS),
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        shard_counts = list(pool.map(_build_shard, [catalog] * count, range(count), [count] * count))
+
+    connection = sqlite3.connect(f"file:{catalog}?mode=ro", uri=True)
+    problems = []
+    for table, _ in SHARDED_TABLES:
+        expected = connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        actual = sum(counts[table] for counts in shard_counts)
+        if actual != expected:
+            problems.append(f"shards hold {actual} of {expected} {table} rows")
+    connection.close()
+    return problems
+
+
+_pool = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        # spawn, so workers never inherit open SQLite connections or threads
+        _pool = ProcessPoolExecutor(max_workers=SHARD_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def scatter(paths, query, params=(), partial=_run_partial):
+    """Run query on every shard in parallel and return each shard's rows (or partial's result)."""
+    futures = [get_pool().submit(partial, path, query, params) for path in paths]
+    return [future.result() for future in futures]
+
+
+# Merges of per-shard partial results
+
+def merge_sums(partials, key_columns=1):
+    """Add up the value columns of rows sharing the same key columns."""
+    totals = {}
+    for rows in partials:
+        for row in rows:
+            key = row[:key_columns]
+            values = row[key_columns:]
+            current = totals.get(key)
+            totals[key] = list(values) if current is None else [
+                (a or 0) + (b or 0) if a is not None or b is not None else None for a, b in zip(current, values)]
+    return totals
+
+
+def merge_distinct(partials):
+    """Merge the per-shard distinct-value sketches of rows sharing the same key."""
+    merged = {}
+    for sketches in partials:
+        for key, sketch in sketches.items():
+            current = merged.get(key)
+            if current is None:
+                merged[key] = sketch
+            elif isinstance(sketch, set):
+                merged[key] = _add_hashes(current, sketch)
+            elif isinstance(current, set):
+                merged[key] = _add_hashes(sketch, current)
+            else:
+                current.merge(sketch)
+    return merged
+
+
+def distinct_bounds(sketch):
+    """Lower and upper bound on a merged sketch's distinct count; equal while it is exact."""
+    if isinstance(sketch, set):
+        return len(sketch), len(sketch)
+    estimate = sketch.estimate()
+    margin = ERROR_MARGIN * sketch.relative_error() * estimate
+    return estimate - margin, estimate + margin
+
+
+def top_k(rows, k, score=lambda row: row[-1]):
+    return sorted(rows, key=score, reverse=True)[:k]
+
+
+def _artist_averages(paths, query, min_tracks):
+    """(artist, average duration) for artists with more than min_tracks tracks."""
+    totals = merge_sums(scatter(paths, query))
+    return [(artist, total / counted) for (artist,), (tracks, total, counted) in totals.items()
+            if tracks > min_tracks and counted]
+
+
+# Scatter-gather plans for the database_queries functions, by function name.
+# Each takes the shard paths and returns what the function returns.
+
+def top_albums_by_track_count(paths):
+    totals = merge_sums(scatter(paths, '''
+        SELECT t.album_name, COUNT(t.track_uri)
+        FROM Tracks t
+        JOIN Playlists p ON t.playlist_id = p.pid
+        WHERE p.num_followers > 1000
+        AND t.album_name IS NOT NULL
+        GROUP BY t.album_name
+    '''))
+    return top_k([(album, count) for (album,), (count,) in totals.items()], 5)
+
+
+def average_track_duration_per_album(paths):
+    # Tracks count towards the >10 threshold even without a playlist, but only joined ones are averaged
+    return top_k(_artist_averages(paths, '''
+        SELECT t.artist_name, COUNT(*),
+               SUM(CASE WHEN p.pid IS NOT NULL THEN t.duration_ms END),
+               COUNT(CASE WHEN p.pid IS NOT NULL THEN t.duration_ms END)
+        FROM Tracks t
+        LEFT JOIN Playlists p ON t.playlist_id = p.pid
+        GROUP BY t.artist_name
+    ''', 10), 15)
+
+
+def playlists_with_most_artists(paths):
+    return _top_playlist_names(paths, ['artist_name'], 15)
+
+
+def _artist_track_counts(paths, min_followers):
+    totals = merge_sums(scatter(paths, '''
+        SELECT t.artist_name, COUNT(t.track_uri)
+        FROM Tracks t
+        JOIN Playlists p ON t.playlist_id = p.pid
+        WHERE p.num_followers > ?
+        GROUP BY t.artist_name
+    ''', (min_followers,)))
+    return [(artist, count) for (artist,), (count,) in totals.items()]
+
+
+def top_artists_by_track_count(paths):
+    return top_k(_artist_track_counts(paths, 1000), 15)
+
+
+def average_tracks_per_playlist(paths):
+    (total, playlists), = merge_sums(scatter(paths, '''
+        SELECT SUM(track_count), COUNT(*)
+        FROM PlaylistFeatures
+        WHERE track_count > 0
+    '''), key_columns=0).values()
+    return total / playlists if playlists else None
+
+
+def albums_with_more_than_five_tracks(paths):
+    totals = merge_sums(scatter(paths, '''
+        SELECT t.album_name, COUNT(t.track_uri)
+        FROM Tracks t
+        JOIN Playlists p ON t.playlist_id = p.pid
+        WHERE p.num_followers > 500
+        GROUP BY t.album_name
+    '''))
+    return [(album,) for (album,), (count,) in totals.items() if count > 5]
+
+
+def _distinct_per_playlist_name(paths, column):
+    # Playlist names repeat across shards, so each shard sends a sketch of every
+    # name's values rather than a count; the sketches are bounded in size, not in Tracks
+    return merge_distinct(scatter(paths, f'''
+        SELECT DISTINCT p.name, t.{column}
+        FROM Playlists p
+        JOIN Tracks t ON p.pid = t.playlist_id
+    ''', partial=_run_distinct))
+
+
+def _distinct_values(paths, column, names):
+    """Exact {name: distinct values of column} for the given playlist names."""
+    values = defaultdict(set)
+    for rows in scatter(paths, f'''
+        SELECT DISTINCT p.name, t.{column}
+        FROM Playlists p
+        JOIN Tracks t ON p.pid = t.playlist_id
+        WHERE p.name IN (SELECT value FROM json_each(?))
+        AND t.{column} IS NOT NULL
+    ''', (json.dumps(names),)):
+        for name, value in rows:
+            values[name].add(value)
+    return values
+
+
+def _top_playlist_names(paths, columns, k, minimum=0):
+    """Top k (name, distinct count per column) rows by the sum of the counts, keeping sums >= minimum.
+
+    The merged sketches bound every name's counts. Only names whose upper bound
+    reaches the k-th best lower bound can make the list, and the estimated ones
+    among them are recounted from their values, so the counts returned are exact.
+    """
+    sketches = [_distinct_per_playlist_name(paths, column) for column in columns]
+    bounds = {}
+    for name in set().union(*sketches):
+        per_column = [distinct_bounds(merged[name]) if name in merged else (0, 0) for merged in sketches]
+        bounds[name] = (sum(low for low, _ in per_column), sum(high for _, high in per_column))
+    lows = sorted((low for low, _ in bounds.values() if low >= minimum), reverse=True)
+    threshold = lows[k - 1] if len(lows) >= k else minimum
+    candidates = [name for name, (_, high) in bounds.items() if high >= threshold]
+
+    estimated = [name for name in candidates if any(isinstance(merged.get(name), HyperLogLog) for merged in sketches)]
+    exact = [_distinct_values(paths, column, estimated) if estimated else {} for column in columns]
+    rows = []
+    for name in candidates:
+        counts = [len(values[name]) if name in estimated else len(merged.get(name, ()))
+                  for merged, values in zip(sketches, exact)]
+        if sum(counts) >= minimum:
+            rows.append((name, *counts))
+    return top_k(rows, k, score=lambda row: sum(row[1:]))
+
+
+def playlists_with_multiple_artists(paths):
+    return _top_playlist_names(paths, ['artist_name'], 15, minimum=2)
+
+
+def artist_popularity_by_track_occurrences(paths):
+    return top_k(_artist_track_counts(paths, 1000), 15)
+
+
+def playlists_with_high_avg_track_duration_artists(paths):
+    # Two phases: the artists with more than 5 tracks overall, then the
+    # per-name averages over their tracks, which every shard filters by that list
+    counts = merge_sums(scatter(paths, 'SELECT artist_name, COUNT(track_uri) FROM Tracks GROUP BY artist_name'))
+    artists = json.dumps([artist for (artist,), (count,) in counts.items() if count > 5])
+    totals = merge_sums(scatter(paths, '''
+        SELECT p.name, SUM(t.duration_ms), COUNT(t.duration_ms)
+        FROM Tracks t
+        JOIN Playlists p ON t.playlist_id = p.pid
+        WHERE p.num_followers > 500
+        AND t.artist_name IN (SELECT value FROM json_each(?))
+        GROUP BY p.name
+    ''', (artists,)))
+    return top_k([(name, total / counted) for (name,), (total, counted) in totals.items() if counted], 15)
+
+
+def total_tracks_in_collaborative_playlists(paths):
+    (total,), = merge_sums(scatter(paths, '''
+        SELECT SUM(f.track_count)
+        FROM PlaylistFeatures f
+        JOIN Playlists p ON f.pid = p.pid
+        WHERE p.collaborative = TRUE
+        AND f.follower_bucket >= 4
+    '''), key_columns=0).values()
+    return total
+
+
+def average_track_duration(paths):
+    return top_k(_artist_averages(paths, '''
+        SELECT artist_name, COUNT(*), SUM(duration_ms), COUNT(duration_ms)
+        FROM Tracks
+        GROUP BY artist_name
+    ''', 10), 15)
+
+
+def playlists_with_diverse_artists_and_albums(paths):
+    return _top_playlist_names(paths, ['artist_name', 'album_name'], 15)
+
+
+def artist_popularity_index(paths):
+    totals = merge_sums(scatter(paths, '''
+        SELECT t.artist_name, p.num_followers, COUNT(*)
+        FROM Tracks t
+        JOIN Playlists p ON t.playlist_id = p.pid
+        GROUP BY t.artist_name, p.num_followers
+    '''), key_columns=2)
+    index = defaultdict(float)
+    for (artist, followers), (count,) in totals.items():
+        if followers is not None:
+            index[artist] += count * 0.7 + followers * 0.3
+    return top_k(list(index.items()), 15)
+
+
+PLANS = {
+    'get_top_albums_by_track_count': top_albums_by_track_count,
+    'calculate_average_track_duration_per_album': average_track_duration_per_album,
+    'identify_playlists_with_most_artists': playlists_with_most_artists,
+    'get_top_artists_by_track_count': top_artists_by_track_count,
+    'calculate_average_tracks_per_playlist': average_tracks_per_playlist,
+    'get_albums_with_more_than_five_tracks': albums_with_more_than_five_tracks,
+    'find_playlists_with_multiple_artists': playlists_with_multiple_artists,
+    'get_artist_popularity_by_track_occurrences': artist_popularity_by_track_occurrences,
+    'find_playlists_with_high_avg_track_duration_artists': playlists_with_high_avg_track_duration_artists,
+    'get_total_tracks_in_collaborative_playlists': total_tracks_in_collaborative_playlists,
+    'calculate_average_track_duration': average_track_duration,
+    'find_playlists_with_diverse_artists_and_albums': playlists_with_diverse_artists_and_albums,
+    'calculate_artist_popularity_index': artist_popularity_index,
+}
+
+
+def run_plan(name, database=None):
+    """Run the named query's scatter-gather plan on the catalog's shards.
+
+    Returns (True, result), or (False, None) when the query has no plan or the
+    catalog has no complete set of shards.
+    """
+    plan = PLANS.get(name)
+    paths = shard_paths(resolve_database(database or DATABASE)) if plan else None
+    if not paths:
+        return False, None
+    return True, plan(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split the catalog's playlists and tracks into shard files.")
+    parser.add_argument("--database", default=DATABASE)
+    parser.add_argument("--shards", type=int, default=SHARD_COUNT or os.cpu_count())
+    args = parser.parse_args()
+
+    catalog = resolve_database(args.database)
+    problems = split_database(catalog, args.shards)
+    if problems:
+        raise SystemExit("Sharding failed: " + "; ".join(problems))
+    print(f"Split {catalog} into {args.shards} shards")
+
+
+if __name__ == "__main__":
+    main()
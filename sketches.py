@@ -0,0 +1,160 @@
+import hashlib
+import json
+import math
+import struct
+from array import array
+
+
+def hash64(value):
+    """Stable 64-bit hash of a string (Python's hash() is salted per process)."""
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'little')
+
+
+class HyperLogLog:
+    """Distinct-count sketch with 2**precision one-byte registers."""
+
+    def __init__(self, precision=10, registers=None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = registers if registers is not None else bytearray(self.m)
+
+    def add(self, value):
+        self.add_hash(hash64(value))
+
+    def add_hash(self, h):
+        index, rank = self.position(h)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def position(self, h):
+        """Register index and rank for a hash, reusable across sketches of the same precision."""
+        bits = 64 - self.precision
+        rest = h & ((1 << bits) - 1)
+        return h >> bits, bits - rest.bit_length() + 1
+
+    def add_positions(self, positions):
+        registers = self.registers
+        for index, rank in positions:
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def estimate(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return m * math.log(m / zeros)
+        return raw
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs with different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def relative_error(self):
+        """Standard error of the estimate as a fraction of the true count."""
+        return 1.04 / math.sqrt(self.m)
+
+    def to_bytes(self):
+        return bytes([self.precision]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data[0], bytearray(data[1:]))
+
+
+class CountMinSketch:
+    """Frequency sketch; estimates never undercount and overcount by at most
+    e / width * total with probability 1 - e**-depth."""
+
+    def __init__(self, width=2 ** 16, depth=4, counters=None, total=0):
+        self.width = width
+        self.depth = depth
+        self.counters = counters if counters is not None else array('Q', bytes(8 * width * depth))
+        self.total = total
+
+    def _indexes(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, item, count=1):
+        indexes = self._indexes(item)
+        for index in indexes:
+            self.counters[index] += count
+        self.total += count
+        return min(self.counters[index] for index in indexes)
+
+    def estimate(self, item):
+        return min(self.counters[index] for index in self._indexes(item))
+
+    def merge(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Cannot merge Count-Min sketches with different dimensions")
+        for i, value in enumerate(other.counters):
+            self.counters[i] += value
+        self.total += other.total
+        return self
+
+    def error_bound(self):
+        """Upper bound on the overcount of any single estimate."""
+        return math.e / self.width * self.total
+
+    def to_bytes(self):
+        return struct.pack('<IIQ', self.width, self.depth, self.total) + self.counters.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        width, depth, total = struct.unpack_from('<IIQ', data)
+        counters = array('Q')
+        counters.frombytes(data[struct.calcsize('<IIQ'):])
+        return cls(width, depth, counters, total)
+
+
+class HeavyHitters:
+    """Top-k frequent items: a Count-Min sketch plus the current best candidates."""
+
+    def __init__(self, capacity=100, sketch=None, candidates=None):
+        self.capacity = capacity
+        self.sketch = sketch if sketch is not None else CountMinSketch()
+        self.candidates = candidates if candidates is not None else {}
+        self.min_count = 0
+
+    def add(self, item, count=1):
+        estimate = self.sketch.add(item, count)
+        if item in self.candidates or len(self.candidates) < self.capacity:
+            self.candidates[item] = estimate
+        elif estimate > self.min_count:
+            smallest = min(self.candidates, key=self.candidates.get)
+            self.min_count = self.candidates[smallest]
+            if estimate > self.min_count:
+                del self.candidates[smallest]
+                self.candidates[item] = estimate
+                self.min_count = min(self.candidates.values())
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+        items = set(self.candidates) | set(other.candidates)
+        counts = sorted(((self.sketch.estimate(item), item) for item in items), reverse=True)
+        self.candidates = {item: count for count, item in counts[:self.capacity]}
+        self.min_count = min(self.candidates.values(), default=0)
+        return self
+
+    def top(self, n=15):
+        return sorted(self.candidates.items(), key=lambda item: item[1], reverse=True)[:n]
+
+    def to_bytes(self):
+        header = json.dumps({"capacity": self.capacity, "candidates": self.candidates}).encode()
+        return struct.pack('<I', len(header)) + header + self.sketch.to_bytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        (length,) = struct.unpack_from('<I', data)
+        header = json.loads(data[4:4 + length])
+        hitters = cls(header["capacity"], CountMinSketch.from_bytes(data[4 + length:]), header["candidates"])
+        hitters.min_count = min(hitters.candidates.values(), default=0)
+        return hitters
@@ -0,0 +1,99 @@
+import fnmatch
+import glob
+import gzip
+import os
+import queue
+import threading
+import zipfile
+
+from json_decoding import get_decoder
+
+# Slices decoded ahead of the consumer; each MPD slice is about 30 MB of JSON
+PREFETCH = 2
+
+SLICE_PATTERN = '*.json'
+
+
+def _open_zstd(path):
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(f"Reading {path} needs the zstandard package (pip install zstandard)") from None
+    return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+
+
+def iter_raw_slices(inputs):
+    """Yield (name, bytes) for every slice in inputs.
+
+    Each input is a path or glob pattern naming .json files, .json.gz or
+    .json.zst files, or .zip archives (such as the MPD download), whose
+    .json members are read without extracting them to disk.
+    """
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    for pattern in inputs:
+        for path in sorted(glob.glob(pattern)):
+            if path.endswith('.zip'):
+                with zipfile.ZipFile(path) as archive:
+                    for member in sorted(archive.namelist()):
+                        if fnmatch.fnmatch(os.path.basename(member), SLICE_PATTERN):
+                            with archive.open(member) as f:
+                                yield member, f.read()
+            elif path.endswith('.gz'):
+                with gzip.open(path, 'rb') as f:
+                    yield path, f.read()
+            elif path.endswith('.zst'):
+                with _open_zstd(path) as f:
+                    yield path, f.read()
+            else:
+                with open(path, 'rb') as f:
+                    yield path, f.read()
+
+
+def iter_slices(inputs, decode=None, prefetch=PREFETCH):
+    """Yield (name, playlists) for every slice in inputs.
+
+    A producer thread reads, decompresses and decodes up to prefetch slices
+    ahead, so that work overlaps with whatever the caller does with each slice
+    (decompression and SQLite both release the GIL). decode defaults to the
+    fastest installed decoder from json_decoding.
+    """
+    decode = decode or get_decoder()
+    slices = queue.Queue(maxsize=prefetch)
+    done = object()
+    stop = threading.Event()
+
+    def put(item):
+        # Give up once the consumer has stopped, instead of blocking on a full queue
+        while not stop.is_set():
+            try:
+                slices.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for name, data in iter_raw_slices(inputs):
+                if not put((name, decode(data))):
+                    return
+        except BaseException as e:
+            put(e)
+            return
+        put(done)
+
+    producer = threading.Thread(target=produce, name='slice-reader', daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = slices.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # The consumer stopped early (or failed): let the producer exit
+        stop.set()
+        producer.join()
@@ -0,0 +1,232 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+import import_json
+from analytics_backends import columnar_directory
+from artist_graph import build_from_database, graph_directory
+from generations import publish_generation, remove_versions, resolve_database
+from sharding import SHARD_COUNT, remove_shards, split_database
+
+DATABASE = os.environ.get('RECOMMENDATION_DB', 'recommendation.db')
+
+# Generations kept on disk, including the published one, so a bad release can be rolled back by hand
+KEEP_GENERATIONS = 2
+
+# A new snapshot with fewer playlists than this share of the live one is refused unless forced
+MIN_PLAYLIST_RATIO = 0.9
+
+# The DuckDB backend reads a Parquet export of the published generation, so export each new one
+COLUMNAR_EXPORT = os.environ.get('ANALYTICS_BACKEND') == 'duckdb'
+
+GENERATION_PATTERN = re.compile(r'\.\d{8}-\d{6}$')
+
+
+def generation_path(database):
+    """A new, timestamped generation file next to database."""
+    base, extension = os.path.splitext(database)
+    path = f"{base}.{time.strftime('%Y%m%d-%H%M%S')}{extension}"
+    if os.path.exists(path):
+        raise FileExistsError(f"Generation {path} already exists")
+    return path
+
+
+def list_generations(database):
+    """Generation files of database, oldest first."""
+    base, extension = os.path.splitext(database)
+    paths = glob.glob(f"{glob.escape(base)}.*{extension}")
+    return sorted(path for path in paths if GENERATION_PATTERN.search(os.path.splitext(path)[0]))
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def collect_counts(connection):
+    """Row counts and totals that every complete catalog has to agree on."""
+    queries = {
+        'playlists': 'SELECT COUNT(*) FROM Playlists',
+        'tracks': 'SELECT COUNT(*) FROM Tracks',
+        'track_occurrences': 'SELECT COALESCE(SUM(num_tracks), 0) FROM Playlists',
+        'playlists_with_tracks': 'SELECT COUNT(DISTINCT playlist_id) FROM Tracks',
+        'artists': 'SELECT COUNT(DISTINCT artist_name) FROM Tracks',
+        'playlist_features': 'SELECT COUNT(*) FROM PlaylistFeatures',
+        'playlist_feature_tracks': 'SELECT COALESCE(SUM(track_count), 0) FROM PlaylistFeatures',
+        'artist_monthly_tracks': 'SELECT COALESCE(SUM(track_count), 0) FROM ArtistMonthlyCounts',
+        'track_monthly_tracks': 'SELECT COALESCE(SUM(track_count), 0) FROM TrackMonthlyCounts',
+        'top_track_artists': 'SELECT COUNT(DISTINCT artist_name) FROM ArtistTopTracks',
+        'analyzed_indexes': 'SELECT COUNT(*) FROM sqlite_stat1',
+    }
+    return {name: connection.execute(query).fetchone()[0] for name, query in queries.items()}
+
+
+def validate_snapshot(path, expected_playlists=None):
+    """Check a built generation; return (counts, list of problems found)."""
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        integrity = connection.execute('PRAGMA quick_check').fetchone()[0]
+        try:
+            counts = collect_counts(connection)
+        except sqlite3.Error as e:
+            return {}, [f"missing table: {e}"]
+    finally:
+        connection.close()
+
+    checks = [
+        (integrity == 'ok', f"integrity check failed: {integrity}"),
+        (counts['playlists'] > 0 and counts['tracks'] > 0, "no playlists or tracks"),
+        (expected_playlists is None or counts['playlists'] == expected_playlists,
+         f"{counts['playlists']} playlists stored but {expected_playlists} read"),
+        (counts['playlist_features'] == counts['playlists_with_tracks'],
+         f"{counts['playlist_features']} PlaylistFeatures rows for {counts['playlists_with_tracks']} playlists"),
+        (counts['playlist_feature_tracks'] == counts['tracks'],
+         f"PlaylistFeatures counts {counts['playlist_feature_tracks']} of {counts['tracks']} tracks"),
+        # The monthly counts count every occurrence in a playlist, not the deduplicated Tracks rows
+        (counts['artist_monthly_tracks'] == counts['track_occurrences'],
+         f"ArtistMonthlyCounts counts {counts['artist_monthly_tracks']} of {counts['track_occurrences']} playlist tracks"),
+        (counts['track_monthly_tracks'] == counts['track_occurrences'],
+         f"TrackMonthlyCounts counts {counts['track_monthly_tracks']} of {counts['track_occurrences']} playlist tracks"),
+        (counts['top_track_artists'] == counts['artists'],
+         f"ArtistTopTracks covers {counts['top_track_artists']} of {counts['artists']} artists"),
+        (counts['analyzed_indexes'] > 0, "no ANALYZE statistics"),
+    ]
+    return counts, [problem for ok, problem in checks if not ok]
+
+
+def live_playlist_count(database):
+    """Playlists in the currently published catalog, 0 if there is none."""
+    path = resolve_database(database)
+    if not os.path.exists(path):
+        return 0
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return connection.execute('SELECT COUNT(*) FROM Playlists').fetchone()[0]
+    except sqlite3.Error:
+        return 0
+    finally:
+        connection.close()
+
+
+def remove_old_generations(database, keep=KEEP_GENERATIONS):
+    """Delete all but the newest keep validated generations, and any that failed validation.
+
+    The published generation is never deleted. Processes still reading a
+    deleted generation keep their open file until they notice the new one
+    and reopen.
+    """
+    current = os.path.abspath(resolve_database(database))
+    generations = list_generations(database)
+    # Only validated generations get a manifest
+    kept = [path for path in generations if os.path.exists(path + '.json')][-keep:]
+    for path in generations:
+        if path not in kept and os.path.abspath(path) != current:
+            for name in (path, path + '.json'):
+                if os.path.exists(name):
+                    os.remove(name)
+            remove_shards(path)
+            remove_versions(graph_directory(path))
+            remove_versions(columnar_directory(path))
+
+
+def build_snapshot(inputs, database=None, build_sketches=True, build_graph=True, force=False, shards=SHARD_COUNT,
+                   columnar=COLUMNAR_EXPORT):
+    """Import inputs into a new generation of database, validate it and publish it.
+
+    The live catalog keeps serving untouched while the generation is built.
+    With shards, the generation is also split into that many shard files for
+    the "sharded" analytics backend, and with columnar exported to Parquet
+    for the "duckdb" one.
+    Returns the published generation's path; raises RuntimeError if validation
+    fails, leaving the generation on disk for inspection until the next build.
+    """
+    database = database or DATABASE
+    path = generation_path(database)
+    started = time.time()
+
+    configured = import_json.DATABASE
+    import_json.DATABASE = path
+    try:
+        playlist_count = import_json.main(inputs, build_sketches=build_sketches, build_graph=False)
+    finally:
+        import_json.DATABASE = configured
+
+    connection = sqlite3.connect(path)
+    # Planner statistics ship with the generation, so it is fast from its first query
+    connection.execute('ANALYZE')
+    connection.execute('PRAGMA optimize')
+    connection.commit()
+    graph = build_from_database(connection) if build_graph else None
+    connection.close()
+
+    checksum = file_checksum(path)
+    counts, problems = validate_snapshot(path, playlist_count)
+    if shards:
+        problems.extend(split_database(path, shards))
+    live_playlists = live_playlist_count(database)
+    if not force and counts.get('playlists', 0) < live_playlists * MIN_PLAYLIST_RATIO:
+        problems.append(f"{counts.get('playlists', 0)} playlists is under {MIN_PLAYLIST_RATIO:.0%} "
+                        f"of the live catalog's {live_playlists} (use --force to publish anyway)")
+    if problems:
+        raise RuntimeError(f"Snapshot {path} failed validation: " + "; ".join(problems))
+
+    # The file must be exactly what was built and validated when it goes live
+    if file_checksum(path) != checksum:
+        raise RuntimeError(f"Snapshot {path} changed after validation")
+    manifest = {
+        'generation': os.path.basename(path),
+        'inputs': list(inputs) if not isinstance(inputs, str) else [inputs],
+        'built_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'build_seconds': round(time.time() - started, 1),
+        'sha256': checksum,
+        'counts': counts,
+    }
+    with open(path + '.json', 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Saved next to the generation before publishing, so it is served with its own graph
+    if graph is not None:
+        graph.save(graph_directory(path))
+    if columnar:
+        from columnar_export import export_database
+
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        export_database(connection, columnar_directory(path))
+        connection.close()
+    publish_generation(database, path)
+    remove_old_generations(database)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a new catalog database from MPD slices and swap it in atomically.")
+    parser.add_argument("inputs", nargs="*", default=["data/*.json"],
+                        help="Slice files, globs or archives: *.json, *.json.gz, *.json.zst or the MPD .zip")
+    parser.add_argument("--database", default=DATABASE)
+    parser.add_argument("--no-sketches", action="store_true", help="Skip the approximate-query sketches")
+    parser.add_argument("--no-graph", action="store_true", help="Skip the artist co-occurrence graph")
+    parser.add_argument("--force", action="store_true", help="Publish even if the new catalog is much smaller")
+    parser.add_argument("--shards", type=int, default=SHARD_COUNT, help="Also split the catalog into this many shards")
+    parser.add_argument("--columnar", action="store_true", default=COLUMNAR_EXPORT,
+                        help="Also export the Parquet files for ANALYTICS_BACKEND=duckdb (the default when it is set)")
+    args = parser.parse_args()
+
+    try:
+        path = build_snapshot(args.inputs, args.database, build_sketches=not args.no_sketches,
+                              build_graph=not args.no_graph, force=args.force, shards=args.shards,
+                              columnar=args.columnar)
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    print(f"Published {path} as the catalog for {args.database}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+
+# Playlist lengths in the real dataset
+MIN_PLAYLIST_LENGTH = 5
+MAX_PLAYLIST_LENGTH = 250
+
+# Start and end of the modified_at range seen in the real dataset
+MODIFIED_AT_START = 1262304000  # 2010-01-01
+MODIFIED_AT_END = 1509494400    # 2017-11-01
+
+PLAYLIST_NAMES = [
+    "Country", "Chill", "Rap", "Workout", "Oldies", "Christmas", "Rock", "Party",
+    "Throwbacks", "Jams", "Worship", "Summer", "Feels", "Disney", "Lit", "Running",
+    "Gym", "Road Trip", "Sleep", "Study", "Car", "Music", "Vibes", "Pop", "Indie",
+    "Old School", "Happy", "Sad", "Dance", "Slow Jams", "Classic Rock", "Throwback",
+]
+
+WORDS = [
+    "love", "night", "heart", "fire", "light", "dream", "summer", "gold", "river",
+    "city", "blue", "wild", "home", "girl", "time", "rain", "stars", "money", "road",
+    "dance", "ocean", "ghost", "young", "lost", "sun", "midnight", "electric", "honey",
+]
+
+
+def zipf_cum_weights(n, exponent):
+    """Cumulative Zipf weights for ranks 1..n, usable with random.choices."""
+    return list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, n + 1)))
+
+
+def make_uri(kind, rng):
+    return f"spotify:{kind}:{rng.getrandbits(88):022x}"
+
+
+def make_title(rng, words=2):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).title()
+
+
+def build_catalog(num_playlists, rng, artist_exponent=1.0):
+    """Create artists, albums and tracks scaled to the playlist count (roughly MPD ratios)."""
+    num_artists = max(50, int(num_playlists * 0.3))
+    # At least enough distinct tracks to fill the longest playlist
+    num_tracks = max(MAX_PLAYLIST_LENGTH, int(num_playlists * 2.2))
+
+    artists = [(f"{make_title(rng)} {i}", make_uri("artist", rng)) for i in range(num_artists)]
+    artist_weights = zipf_cum_weights(num_artists, artist_exponent)
+
+    albums_by_artist = {}
+    tracks = []
+    for artist_index in rng.choices(range(num_artists), cum_weights=artist_weights, k=num_tracks):
+        artist_name, artist_uri = artists[artist_index]
+        albums = albums_by_artist.setdefault(artist_index, [])
+        if not albums or rng.random() < 0.15:
+            albums.append((make_title(rng, 3), make_uri("album", rng)))
+        album_name, album_uri = rng.choice(albums)
+        tracks.append({
+            "artist_name": artist_name,
+            "track_uri": make_uri("track", rng),
+            "artist_uri": artist_uri,
+            "track_name": f"{make_title(rng)} {len(tracks)}",
+            "album_uri": album_uri,
+            "duration_ms": int(min(max(rng.lognormvariate(12.3, 0.3), 30000), 1200000)),
+            "album_name": album_name,
+        })
+    return tracks
+
+
+def playlist_length(rng):
+    """Playlist length drawn to match the MPD distribution (5 to 250, median about 49)."""
+    return int(min(max(rng.lognormvariate(math.log(49), 0.8), MIN_PLAYLIST_LENGTH), MAX_PLAYLIST_LENGTH))
+
+
+def generate_playlist(pid, tracks, track_weights, name_weights, rng):
+    # A playlist holds distinct tracks, so it can't be longer than the catalog
+    length = min(playlist_length(rng), len(tracks))
+    chosen = {}
+    while len(chosen) < length:
+        for index in rng.choices(range(len(tracks)), cum_weights=track_weights, k=length - len(chosen)):
+            chosen.setdefault(index, None)
+    playlist_tracks = []
+    for pos, index in enumerate(chosen):
+        track = dict(tracks[index])
+        track["pos"] = pos
+        playlist_tracks.append(track)
+
+    return {
+        "name": rng.choices(PLAYLIST_NAMES, cum_weights=name_weights)[0],
+        "collaborative": "true" if rng.random() < 0.02 else "false",
+        "pid": pid,
+        "modified_at": rng.randint(MODIFIED_AT_START, MODIFIED_AT_END),
+        "num_tracks": len(playlist_tracks),
+        "num_albums": len({t["album_uri"] for t in playlist_tracks}),
+        "num_followers": min(int(rng.paretovariate(0.9)), 100000),
+        "num_edits": rng.randint(1, 50),
+        "duration_ms": sum(t["duration_ms"] for t in playlist_tracks),
+        "num_artists": len({t["artist_uri"] for t in playlist_tracks}),
+        "tracks": playlist_tracks,
+    }
+
+
+def generate_slices(output_dir, num_playlists, seed=0, slice_size=1000,
+                    artist_exponent=1.0, track_exponent=1.1):
+    """Write mpd.slice.*.json files in the real MPD schema and return their paths."""
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    tracks = build_catalog(num_playlists, rng, artist_exponent)
+    # The catalog is built in artist order, so shuffle before ranking track popularity
+    rng.shuffle(tracks)
+    track_weights = zipf_cum_weights(len(tracks), track_exponent)
+    name_weights = zipf_cum_weights(len(PLAYLIST_NAMES), 1.0)
+
+    paths = []
+    for start in range(0, num_playlists, slice_size):
+        end = min(start + slice_size, num_playlists) - 1
+        playlists = [generate_playlist(pid, tracks, track_weights, name_weights, rng)
+                     for pid in range(start, end + 1)]
+        path = os.path.join(output_dir, f"mpd.slice.{start}-{end}.json")
+        with open(path, 'w') as f:
+            json.dump({
+                "info": {
+                    "generated_on": "synthetic",
+                    "slice": f"{start}-{end}",
+                    "version": "v1",
+                },
+                "playlists": playlists,
+            }, f, indent=1)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic MPD slice files.")
+    parser.add_argument("--playlists", type=int, default=1000)
+    parser.add_argument("--output", default="data")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--slice-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    paths = generate_slices(args.output, args.playlists, args.seed, args.slice_size)
+    print(f"Wrote {len(paths)} slice files to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import sqlite3
+
+from artist_top_tracks import refresh_top_tracks
+from trending_queries import create_trending_tables, update_monthly_counts
+
+
+def playlist(modified_at, *track_names):
+    return {"modified_at": modified_at,
+            "tracks": [{"artist_name": "Artist", "track_name": name} for name in track_names]}
+
+
+def top_tracks(connection):
+    return connection.execute(
+        'SELECT track_name, track_count FROM ArtistTopTracks WHERE artist_name = ? ORDER BY track_rank',
+        ("Artist",)).fetchall()
+
+
+def test_track_in_most_playlists_ranks_first():
+    connection = sqlite3.connect(':memory:')
+    create_trending_tables(connection)
+    # "Zulu" sorts last by name but occurs in three playlists, two of them in another month
+    update_monthly_counts(connection, [
+        playlist(1500000000, "Alpha", "Zulu"),
+        playlist(1510000000, "Bravo", "Zulu"),
+        playlist(1510000000, "Zulu"),
+    ])
+    refresh_top_tracks(connection)
+    assert top_tracks(connection) == [("Zulu", 3), ("Alpha", 1), ("Bravo", 1)]
+
+
+def test_refresh_for_new_playlists_adds_to_earlier_counts():
+    connection = sqlite3.connect(':memory:')
+    create_trending_tables(connection)
+    update_monthly_counts(connection, [playlist(1500000000, "Alpha", "Bravo"), playlist(1500000000, "Alpha")])
+    refresh_top_tracks(connection, {"Artist"})
+    assert top_tracks(connection)[0] == ("Alpha", 2)
+
+    update_monthly_counts(connection, [playlist(1510000000, "Bravo"), playlist(1510000000, "Bravo")])
+    refresh_top_tracks(connection, {"Artist"})
+    assert top_tracks(connection) == [("Bravo", 3), ("Alpha", 2)]
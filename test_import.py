@@ -1,8 +1,9 @@
-import json
 import sqlite3
 from datetime import datetime
 import glob
 
+from json_decoding import load_slice
+
 def create_connection():
     connection = None
     try:
@@ -101,9 +102,7 @@ def main():
     filename = 'data/mpd.slice.0-999.json' 
     combined_data = []
 
-    with open(filename, 'r') as f:
-        data = json.load(f)
-        combined_data.extend(data['playlists'])  # Load playlists from the file
+    combined_data.extend(load_slice(filename))  # Load playlists from the file
 
     # Insert combined data into the database
     connection = create_connection()
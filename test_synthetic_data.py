@@ -0,0 +1,22 @@
+import json
+import os
+import subprocess
+import sys
+
+from synthetic_data import MAX_PLAYLIST_LENGTH, generate_slices
+
+
+def test_small_catalogs_fill_every_playlist(tmp_path):
+    for num_playlists in (1, 10, 100):
+        paths = generate_slices(str(tmp_path / str(num_playlists)), num_playlists, seed=num_playlists)
+        playlists = [playlist for path in paths for playlist in json.load(open(path))["playlists"]]
+        assert len(playlists) == num_playlists
+        for playlist in playlists:
+            uris = [track["track_uri"] for track in playlist["tracks"]]
+            assert len(uris) == len(set(uris)) == playlist["num_tracks"] <= MAX_PLAYLIST_LENGTH
+
+
+def test_command_line_with_few_playlists(tmp_path):
+    subprocess.run([sys.executable, "synthetic_data.py", "--playlists", "100", "--output", str(tmp_path)],
+                   check=True, timeout=60, cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert (tmp_path / "mpd.slice.0-99.json").exists()
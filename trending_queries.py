@@ -0,0 +1,181 @@
+import argparse
+import sqlite3
+from collections import Counter
+from datetime import datetime
+
+from database_queries import DATABASE, create_connection
+from generations import require_unpublished
+from slice_reader import iter_slices
+
+# Smoothing for the growth ratio, so artists going from 0 to 1 track don't top the list
+GROWTH_SMOOTHING = 5
+
+
+def create_trending_tables(connection):
+    cursor = connection.cursor()
+    # Keyed by month first so a window is one contiguous range of the primary key
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ArtistMonthlyCounts (
+        month TEXT,
+        artist_name TEXT,
+        track_count INTEGER,
+        PRIMARY KEY (month, artist_name)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS TrackMonthlyCounts (
+        month TEXT,
+        artist_name TEXT,
+        track_name TEXT,
+        track_count INTEGER,
+        PRIMARY KEY (month, artist_name, track_name)
+    ) WITHOUT ROWID
+    ''')
+    connection.commit()
+    cursor.close()
+
+
+def tracks_watermark(connection):
+    """Highest Tracks rowid so far; rows inserted afterwards have larger rowids."""
+    return connection.execute('SELECT COALESCE(MAX(rowid), 0) FROM Tracks').fetchone()[0]
+
+
+def update_monthly_counts(connection, playlists):
+    """Add every track occurrence in playlists (decoded slice JSON) to the monthly counts.
+
+    Tracks keeps each track_uri once, so the counts are taken from the JSON as
+    it is ingested, like the sketches. Callers pass only playlists not counted
+    before, so re-importing a slice never double-counts. Months come from the
+    playlist's modified_at, in the same local time as Playlists.modified_at.
+
+    The tables must exist (create_trending_tables). Nothing is committed: the
+    caller commits the counts together with the playlists they were taken from.
+    """
+    artist_counts = Counter()
+    track_counts = Counter()
+    for playlist in playlists:
+        month = datetime.fromtimestamp(playlist["modified_at"]).strftime('%Y-%m')
+        for track in playlist["tracks"]:
+            artist_counts[month, track["artist_name"]] += 1
+            track_counts[month, track["artist_name"], track["track_name"]] += 1
+
+    cursor = connection.cursor()
+    cursor.executemany('''
+        INSERT INTO ArtistMonthlyCounts (month, artist_name, track_count) VALUES (?, ?, ?)
+        ON CONFLICT (month, artist_name) DO UPDATE SET track_count = track_count + excluded.track_count
+    ''', ((month, artist, count) for (month, artist), count in artist_counts.items()))
+    cursor.executemany('''
+        INSERT INTO TrackMonthlyCounts (month, artist_name, track_name, track_count) VALUES (?, ?, ?, ?)
+        ON CONFLICT (month, artist_name, track_name) DO UPDATE SET track_count = track_count + excluded.track_count
+    ''', ((month, artist, track, count) for (month, artist, track), count in track_counts.items()))
+    cursor.close()
+
+
+def rebuild_monthly_counts(connection, inputs):
+    """Recompute the monthly counts from the slices in inputs, for the playlists stored in Playlists."""
+    create_trending_tables(connection)
+    connection.execute('DELETE FROM ArtistMonthlyCounts')
+    connection.execute('DELETE FROM TrackMonthlyCounts')
+    stored = {row[0] for row in connection.execute('SELECT pid FROM Playlists')}
+    for name, playlists in iter_slices(inputs):
+        update_monthly_counts(connection, [playlist for playlist in playlists if playlist["pid"] in stored])
+    connection.commit()
+
+
+def _shift_month(month, months):
+    year, month = divmod(int(month[:4]) * 12 + int(month[5:7]) - 1 + months, 12)
+    return f"{year:04d}-{month + 1:02d}"
+
+
+def _run(query, params=(), fetch_one=False):
+    connection = create_connection()
+    if connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(query, params)
+            return cursor.fetchone() if fetch_one else cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"SQLite error: {e}")
+            return None
+        finally:
+            cursor.close()
+            connection.close()
+
+
+def get_months():
+    """Every month with counts, oldest first, as YYYY-MM strings."""
+    rows = _run('SELECT DISTINCT month FROM ArtistMonthlyCounts ORDER BY month')
+    return [row[0] for row in rows] if rows else []
+
+
+def get_top_artists_in_window(start_month, end_month, limit=15):
+    """Artists with the most tracks in playlists last modified between two months (inclusive)."""
+    return _run('''
+        SELECT artist_name, SUM(track_count) AS track_count
+        FROM ArtistMonthlyCounts
+        WHERE month BETWEEN ? AND ?
+        GROUP BY artist_name
+        ORDER BY track_count DESC
+        LIMIT ?;
+    ''', (start_month, end_month, limit))
+
+
+def get_top_tracks_in_window(start_month, end_month, limit=15):
+    """Tracks appearing most in playlists last modified between two months (inclusive)."""
+    return _run('''
+        SELECT artist_name, track_name, SUM(track_count) AS track_count
+        FROM TrackMonthlyCounts
+        WHERE month BETWEEN ? AND ?
+        GROUP BY artist_name, track_name
+        ORDER BY track_count DESC
+        LIMIT ?;
+    ''', (start_month, end_month, limit))
+
+
+def get_fastest_rising_artists(window_months=3, end_month=None, limit=15):
+    """Artists whose track count grew most from the previous window to the latest one.
+
+    Returns (artist, previous count, recent count, growth ratio), where the ratio
+    is smoothed by GROWTH_SMOOTHING on both sides.
+    """
+    if end_month is None:
+        row = _run('SELECT MAX(month) FROM ArtistMonthlyCounts', fetch_one=True)
+        if not row or row[0] is None:
+            return []
+        end_month = row[0]
+    recent_start = _shift_month(end_month, 1 - window_months)
+    previous_start = _shift_month(end_month, 1 - 2 * window_months)
+    return _run('''
+        SELECT artist_name, previous, recent,
+               (recent + ?1) * 1.0 / (previous + ?1) AS growth
+        FROM (
+            SELECT artist_name,
+                   SUM(CASE WHEN month < ?2 THEN track_count ELSE 0 END) AS previous,
+                   SUM(CASE WHEN month >= ?2 THEN track_count ELSE 0 END) AS recent
+            FROM ArtistMonthlyCounts
+            WHERE month BETWEEN ?3 AND ?4
+            GROUP BY artist_name
+        )
+        WHERE recent > previous
+        ORDER BY growth DESC, recent DESC
+        LIMIT ?5;
+    ''', (GROWTH_SMOOTHING, recent_start, previous_start, end_month, limit))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the monthly trending counts from the imported slices.")
+    parser.add_argument("inputs", nargs="*", default=["data/*.json"],
+                        help="Slice files, globs or archives: *.json, *.json.gz, *.json.zst or the MPD .zip")
+    parser.add_argument("--database", default=DATABASE)
+    args = parser.parse_args()
+
+    require_unpublished(args.database)
+    connection = sqlite3.connect(args.database)
+    rebuild_monthly_counts(connection, args.inputs)
+    months = connection.execute('SELECT COUNT(DISTINCT month) FROM ArtistMonthlyCounts').fetchone()[0]
+    connection.close()
+    print(f"Rebuilt monthly counts for {months} months in {args.database}")
+
+
+if __name__ == "__main__":
+    main()
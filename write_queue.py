@@ -0,0 +1,124 @@
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+# Most writes committed in one transaction
+MAX_BATCH = 500
+# How long a batch is held open for more writes after the queue runs dry. Writes
+# that arrive while the previous batch commits are grouped anyway, so by default
+# a batch commits as soon as the queue is drained; no write waits longer than
+# one commit plus this delay.
+MAX_DELAY = 0
+
+
+class WriteQueue:
+    """Funnels single-row writes through one background thread that group-commits them.
+
+    Every write gets a Future that resolves (to the statement's rowcount) only
+    after the transaction holding it has committed, so a caller that waits on it
+    knows the row is durable; concurrent writers share one commit and one fsync.
+    A statement that fails (for example on a UNIQUE constraint) fails only its
+    own Future, the rest of the batch still commits.
+    """
+
+    def __init__(self, database, max_batch=MAX_BATCH, max_delay=MAX_DELAY):
+        self.database = database
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.pending = queue.Queue()
+        self.closed = False
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def submit(self, sql, params=()):
+        """Queue a write and return a Future for its rowcount."""
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("Write queue is closed")
+            self.pending.put((sql, params, future))
+        return future
+
+    def execute(self, sql, params=()):
+        """Queue a write and wait until it is committed."""
+        return self.submit(sql, params).result()
+
+    def flush(self):
+        """Wait until everything queued so far is committed."""
+        self.submit('SELECT 1').result()
+
+    def close(self):
+        """Commit whatever is still queued and stop the writer thread."""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.pending.put(None)
+        self.thread.join()
+
+    def _run(self):
+        connection = sqlite3.connect(self.database, timeout=30, isolation_level=None)
+        # WAL lets the app's readers (and ingestion's reads) run alongside the writer;
+        # synchronous=FULL makes each committed batch survive a power loss
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=FULL')
+        stopping = False
+        while not stopping:
+            item = self.pending.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    remaining = deadline - time.monotonic()
+                    item = self.pending.get(timeout=remaining) if remaining > 0 else self.pending.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(connection, batch)
+        connection.close()
+
+    def _commit(self, connection, batch):
+        outcomes = []
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            for sql, params, future in batch:
+                try:
+                    outcomes.append((future, connection.execute(sql, params).rowcount, None))
+                except sqlite3.Error as e:
+                    # A failed statement is undone on its own; the transaction stays open
+                    outcomes.append((future, None, e))
+            connection.execute('COMMIT')
+        except sqlite3.Error as e:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for future, rowcount, error in outcomes:
+            if error is None:
+                future.set_result(rowcount)
+            else:
+                future.set_exception(error)
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_write_queue(database):
+    """The process-wide write queue for database, started on first use."""
+    with _queues_lock:
+        write_queue = _queues.get(database)
+        if write_queue is None:
+            write_queue = _queues[database] = WriteQueue(database)
+        return write_queue